@@ -1,11 +1,6 @@
 import streamlit as st
-import pandas as pd
-import geopandas as gpd
-import plotly.express as px
-import plotly.graph_objects as go
-import json
 
-# Page configuration
+# Page configuration, sent before the heavy modules (pandas, geopandas, plotly) are imported by the pages
 st.set_page_config(layout="wide", page_title="A2F VISUALIZATION", page_icon="🌍")
 
 # Display browser zoom recommendation 
@@ -22,446 +17,275 @@ st.markdown(
 st.sidebar.image("OIP.jpg",  use_container_width=True)
 st.sidebar.header("FAP VISUALIZATION")
 
-# Function to load data
-def load_data():
-    return pd.read_csv("A2F_FAP_v1.csv")
-    
-@st.cache_data
-def load_data(file_path):
-    return pd.read_csv(file_path)
-
-# Function to load GeoJSON data for state boundaries
-def load_state_geojson(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-# Function to load GeoJSON data for polygons based on selected state
-def load_polygon_geojson_selected_state(selected_state):
-    file_path = f"polygons/{selected_state.upper()}.geojson"
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-# Function to generate map for FAP functionalities
-def generate_map_fap_functionalities(selected_state, selected_fap_functionality, data, state_gdf, state_geojson_data):
-    zoom_level = 5.85  # Adjusted zoom level for Nigeria
-    center_lat = 9.0820  # Center of Nigeria latitude
-    center_lon = 8.6753  # Center of Nigeria longitude
-    
-    # Load polygon GeoJSON data for the selected state
-    if selected_state != 'All':
-        polygon_geojson_data = load_polygon_geojson_selected_state(selected_state)
-    else:
-        polygon_geojson_data = None
-
-    if selected_state != 'All':
-        filtered_data = data[(data['STATE'] == selected_state) & ((data['FAP_FUNCTIONALITY'] == selected_fap_functionality) | (selected_fap_functionality == 'All'))]
-        map_title = f"FAP FUNCTIONALITIES VISUALIZATION FOR {selected_state} - {selected_fap_functionality}"
-        selected_state_gdf = state_gdf[state_gdf['admin1Name'] == selected_state]
-        if not selected_state_gdf.empty:
-            center_lat = selected_state_gdf.centroid.y.values[0]
-            center_lon = selected_state_gdf.centroid.x.values[0]
-            zoom_level = 7
-    else:
-        filtered_data = data[(data['FAP_FUNCTIONALITY'] == 'Active') | (data['FAP_FUNCTIONALITY'] == 'Inactive')]
-        map_title = f"FAP FUNCTIONALITIES VISUALIZATION FOR NIGERIA - {selected_fap_functionality}"
-        center_lat = 9.0820  # Center of Nigeria latitude
-        center_lon = 8.6753  # Center of Nigeria longitude
-        zoom_level = 5.85  # Adjusted zoom level
-
-    # Defined colors for FAP functionalities
-    fap_colors = {'Active': 'green', 'Inactive': 'red'}
-
-    # Choropleth map for state boundaries
-    fig = px.choropleth_mapbox(selected_state_gdf if selected_state != 'All' else state_gdf, 
-                               geojson=state_gdf.geometry,  # Using GeoJSON data directly
-                               locations=selected_state_gdf.index if selected_state != 'All' else state_gdf.index,  # Using index as locations
-                               mapbox_style="carto-positron",
-                               zoom=zoom_level,
-                               opacity=0.5,
-                               center={"lat": center_lat, "lon": center_lon}  # Setting center of map
-                              )
-
-    # Scatter plot for filtered data
-    for fap_func, color in fap_colors.items():
-        if selected_fap_functionality == 'All' or fap_func == selected_fap_functionality:
-            fap_filtered_data = filtered_data[filtered_data['FAP_FUNCTIONALITY'] == fap_func]
-            fig.add_trace(go.Scattermapbox(
-                lat=fap_filtered_data["LATITUDE"],
-                lon=fap_filtered_data["LONGITUDE"],
-                mode="markers",
-                marker=dict(
-                    size=13,
-                    color=color,
-                    opacity=0.7,
-                ),
-                hovertext=fap_filtered_data['FAP_TYPE'] + ', ' + fap_filtered_data['FORMALITY'] + ', ' + fap_filtered_data['FAP_FUNCTIONALITY'],
-                name=f"{fap_func}"  # Legend label for each marker
-            ))
-
-    # Polygons(EAs) to the figure/map
-    if polygon_geojson_data:
-        for feature in polygon_geojson_data["features"]:
-            if feature["geometry"]["type"] == "Polygon":
-                coords = feature["geometry"]["coordinates"][0]  # Extract the coordinates of the first polygon
-                lats = [coord[1] for coord in coords]  #To  Extract latitude values
-                lons = [coord[0] for coord in coords]  #To Extract longitude values
-                fig.add_trace(go.Scattermapbox(
-                    mode="lines",
-                    lat=lats,
-                    lon=lons,
-                    line=dict(color="purple", width=4),
-                    showlegend=False  # Exclude from legend
-                ))
-
-    # Set layout for the map
-    fig.update_layout(
-        mapbox=dict(
-            style="carto-positron",
-            center=dict(lat=center_lat, lon=center_lon),
-            zoom=zoom_level,
-        ),
-        height=850,
-        margin=dict(r=0, l=0, t=50, b=0),
-        title=map_title,
-        legend=dict(
-            title="FAP Functionality"
-        )
-    )
-
-    return fig
-
-# Function to generate map for FAP types
-def generate_map_fap_types(selected_state, selected_fap_type, data, state_gdf, state_geojson_data):
-    zoom_level = 5.85  # Adjusted zoom level for Nigeria
-    center_lat = 9.0820  # Center of Nigeria latitude
-    center_lon = 8.6753  # Center of Nigeria longitude
-    
-    # Load polygon GeoJSON data for the selected state
-    if selected_state != 'All':
-        polygon_geojson_data = load_polygon_geojson_selected_state(selected_state)
-    else:
-        polygon_geojson_data = None
-
-    if selected_state != 'All':
-        filtered_data = data[data['STATE'] == selected_state]
-        map_title = f"FAP TYPES VISUALIZATION FOR {selected_state}"
-        selected_state_gdf = state_gdf[state_gdf['admin1Name'] == selected_state]
-        if not selected_state_gdf.empty:
-            center_lat = selected_state_gdf.centroid.y.values[0]
-            center_lon = selected_state_gdf.centroid.x.values[0]
-            zoom_level = 7
-    else:
-        filtered_data = data
-        map_title = f"FAP TYPES VISUALIZATION FOR NIGERIA"
-        center_lat = 9.0820  # Center of Nigeria latitude
-        center_lon = 8.6753  # Center of Nigeria longitude
-        zoom_level = 5.85  # Adjusted zoom level
-
-    # Define colors for FAP types
-    fap_colors = {
-        'Financial Service agent (POS agents)': 'green',
-        'Cooperative/ Social group/Women group/savings group/farmer groups etc.': 'blue',
-        'MFI/MFB': 'red',
-        'ATM (This does not include ATMs at a bank branch)': 'orange',
-        'Bank branch': 'purple',
-        'Payment services banks (MTN Y’ello, Money master, 9PSB, Hope)': 'yellow',
-        'Moneylender': 'cyan',
-        'Bureau De Change (BDC)': 'magenta',
-        'Capital market operators (portfolio/fund managers)': 'lime',
-        'Insurance company/agent/broker': 'brown',
-        'Pension provider': 'teal',
-        'Non-Interest Banks': 'pink',
-        'Others (specify)': 'gray'
-    }
-
-    # Create choropleth map for state boundaries
-    fig = px.choropleth_mapbox(selected_state_gdf if selected_state != 'All' else state_gdf, 
-                               geojson=state_gdf.geometry,  # Use GeoJSON data directly
-                               locations=selected_state_gdf.index if selected_state != 'All' else state_gdf.index,  # Use index as locations
-                               mapbox_style="carto-positron",
-                               zoom=zoom_level,
-                               opacity=0.5,
-                               center={"lat": center_lat, "lon": center_lon}  # Set center of map
-                              )
-
-    # Filter data based on selected FAP type
-    if selected_fap_type != 'All':
-        filtered_data = filtered_data[filtered_data['FAP_TYPE'] == selected_fap_type]
-
-    # Add scatter plot for filtered data
-    for fap_type, color in fap_colors.items():
-        fap_filtered_data = filtered_data[filtered_data['FAP_TYPE'] == fap_type]
-        fig.add_trace(go.Scattermapbox(
-            lat=fap_filtered_data["LATITUDE"],
-            lon=fap_filtered_data["LONGITUDE"],
-            mode="markers",
-            marker=dict(
-                size=13,
-                color=color,
-                opacity=0.7,
-            ),
-            hovertext=fap_filtered_data['FAP_TYPE'] + ', ' + fap_filtered_data['FORMALITY'] + ', ' + fap_filtered_data['FAP_FUNCTIONALITY'],
-            name=f"{fap_type}"  # Legend label for each marker
-        ))
-
-    # Add polygons to the figure
-    if polygon_geojson_data:
-        for feature in polygon_geojson_data["features"]:
-            if feature["geometry"]["type"] == "Polygon":
-                coords = feature["geometry"]["coordinates"][0]  # Extract the coordinates of the first polygon
-                lats = [coord[1] for coord in coords]  # Extract latitude values
-                lons = [coord[0] for coord in coords]  # Extract longitude values
-                fig.add_trace(go.Scattermapbox(
-                    mode="lines",
-                    lat=lats,
-                    lon=lons,
-                    line=dict(color="purple", width=4),
-                    showlegend=False  # Exclude from legend
-                ))
-
-    # Set layout for the map
-    fig.update_layout(
-        mapbox=dict(
-            style="carto-positron",
-            center=dict(lat=center_lat, lon=center_lon),
-            zoom=zoom_level,
-        ),
-        height=850,
-        margin=dict(r=0, l=0, t=50, b=0),
-        title=map_title,
-        legend=dict(
-            title="FAP Type"
-        )
-    )
-
-    return fig
-
-# Function to calculate average proximity for each EA
-def calculate_average_proximity(selected_state_data, selected_fap_type):
-    # Filter data by selected FAP type
-    filtered_data = selected_state_data[selected_state_data['FAP_TYPE'] == selected_fap_type]
-    
-    # Group by EA and calculate average proximity for each EA
-    avg_proximity_per_ea = filtered_data.groupby('EA NAME')['KM Diff Calculation'].mean().reset_index()
-    
-    return avg_proximity_per_ea
+# Preload the shared assets in the background once per server process, unless python fap_warmup.py already started
+# it with the server (disable with A2F_WARM_UP=0)
+from fap_warmup import start_warm_up
+start_warm_up()
 
-def generate_km_diff_heatmap(state_gdf, state_geojson_data, data, selected_fap_type, selected_state=None):
-    # Center of Nigeria latitude and longitude
-    center_lat = 9.0820
-    center_lon = 8.6753
-    
-    # Adjusted zoom level
-    zoom_level = 5.85
-
-    title = f"Heatmap of average proximity to FAP in KM"
-
-    if selected_state:
-        # Filter data by selected state
-        filtered_data = data[(data['FAP_TYPE'] == selected_fap_type) & (data['STATE'] == selected_state)]
-        
-        # Group data by state and calculate average KM Diff for the selected state
-        avg_km_diff_by_state = filtered_data.groupby('STATE')['KM Diff Calculation'].mean().reset_index()
-        
-        # Merge average data with state GeoDataFrame for the selected state
-        merged_data = state_gdf.merge(avg_km_diff_by_state, how='left', left_on='admin1Name', right_on='STATE')
-        
-        # Fill missing values with 0 for the selected state
-        merged_data['KM Diff Calculation'].fillna(0, inplace=True)
-        
-        # Create choropleth map for the selected state only
-        fig = px.choropleth_mapbox(merged_data, 
-                                   geojson=merged_data.geometry,  # Use GeoDataFrame geometry
-                                   locations=merged_data.index,  # Use index as locations
-                                   color='KM Diff Calculation',  # Color by average Km_Diff_Calculation
-                                   color_continuous_scale="greens",  # Choose color scale
-                                   range_color=(0, merged_data['KM Diff Calculation'].max()),  # Set color range
-                                   mapbox_style="carto-positron",
-                                   zoom=zoom_level,
-                                   opacity=0.5,
-                                   center={"lat": center_lat, "lon": center_lon}  # Set center of map
-                                  )
-    else:
-        # Filter data by selected FAP type
-        filtered_data = data[data['FAP_TYPE'] == selected_fap_type]
-        
-        # Group data by state and calculate average KM Diff for each state
-        avg_km_diff_by_state = filtered_data.groupby('STATE')['KM Diff Calculation'].mean().reset_index()
-        
-        # Merge average data with state GeoDataFrame
-        merged_data = state_gdf.merge(avg_km_diff_by_state, how='left', left_on='admin1Name', right_on='STATE')
-        
-        # Fill missing values with 0
-        merged_data['KM Diff Calculation'].fillna(0, inplace=True)
-        
-        # Create choropleth map for all states
-        fig = px.choropleth_mapbox(merged_data, 
-                                   geojson=merged_data.geometry,  # Use GeoDataFrame geometry
-                                   locations=merged_data.index,  # Use index as locations
-                                   color='KM Diff Calculation',  # Color by average Km_Diff_Calculation
-                                   color_continuous_scale="greens",  # Choose color scale
-                                   range_color=(0, merged_data['KM Diff Calculation'].max()),  # Set color range
-                                   mapbox_style="carto-positron",
-                                   zoom=zoom_level,
-                                   opacity=0.5,
-                                   center={"lat": center_lat, "lon": center_lon}  # Set center of map
-                                  )
-
-    # Calculate Center Coordinates of States
-    center_pos = {}
-    for feature in state_geojson_data["features"]:
-        state_name = feature["properties"]["admin1Name"]
-        centroid = state_gdf[state_gdf["admin1Name"] == state_name].geometry.centroid.iloc[0]
-        center_pos[state_name] = [centroid.x, centroid.y]
-
-    # Adding Text to the Map
-    for state_name, coords in center_pos.items():
-        avg_value = merged_data[merged_data["admin1Name"] == state_name]["KM Diff Calculation"].iloc[0]
-        fig.add_trace(go.Scattermapbox(
-            lat=[coords[1]],
-            lon=[coords[0]],
-            mode="text",
-            textfont=dict(color="black", size=15),
-            text=str(round(avg_value, 2)),
-            showlegend=False
-        ))
-
-    # Set layout for the map
-    fig.update_layout(
-        mapbox=dict(
-            style="carto-positron",
-            center=dict(lat=center_lat, lon=center_lon),
-            zoom=zoom_level,
-        ),
-        height=850,
-        margin=dict(r=0, l=0, t=50, b=0),
-        title=title
-    )
-
-    return fig
+# Per-rerun stage timings, cache counters and payload sizes (logged for every rerun, shown in the sidebar with ?diagnostics=1)
+from fap_profiling import annotate, diagnostics_enabled, finish_profile, show_diagnostics, stage, start_profile
 
 # Define page 1 content
 def page1():
+    from fap_assets import cached_figure, load_aggregate_cube, load_selection_index, load_state_gdf, load_state_geojson
+    from fap_data import CSV_PATH, MAP_COLUMNS
+    from fap_geo import STATE_GEOJSON_PATH
+    from fap_maps import add_category_filter_menu, generate_map_fap_functionalities
+
     st.sidebar.header("FAP STATUS VISUALIZATION")
     st.title("FAP STATUS VISUALIZATION")
 
-    # Define the file path
-    file_path = "A2F_FAP_v1.csv"
-    data = load_data(file_path)
+    # Load the columns needed by the map and the count table, indexed by selection
+    with stage("load"):
+        selection_index = load_selection_index(CSV_PATH, MAP_COLUMNS)
+        data = selection_index.data
 
-    # Load GeoJSON data for state boundaries
-    state_geojson_data = load_state_geojson("ngaadmbndaadm1osgof20161215.geojson")
-
-    # Convert GeoJSON data to GeoDataFrame for state boundaries
-    state_gdf = gpd.GeoDataFrame.from_features(state_geojson_data["features"])
+        # Load GeoJSON data and the GeoDataFrame for state boundaries (shared across sessions)
+        state_geojson_data = load_state_geojson(STATE_GEOJSON_PATH)
+        state_gdf = load_state_gdf(STATE_GEOJSON_PATH)
 
     # Filter by state and FAP functionality
     states = ['All'] + sorted(list(data['STATE'].unique()))
     selected_state = st.sidebar.selectbox("Select State", states)
 
-    fap_functionalities = ['All', 'Active', 'Inactive']
-    selected_fap_functionality = st.sidebar.radio("Select FAP Functionality", fap_functionalities)
+    # Filtering in the browser builds each state's map once with every functionality and switches with a map dropdown
+    filter_in_browser = st.sidebar.checkbox("Filter FAP Functionality on the map", help="Switch functionality from a dropdown on the map, without reloading it")
+    if filter_in_browser:
+        selected_fap_functionality = 'All'
+    else:
+        fap_functionalities = ['All', 'Active', 'Inactive']
+        selected_fap_functionality = st.sidebar.radio("Select FAP Functionality", fap_functionalities)
+    annotate(state=selected_state, fap_functionality=selected_fap_functionality, filter_in_browser=filter_in_browser)
 
     # Display map in column 2
     col1, col2 = st.columns([10, 2], gap='medium')
     
     # Display the map
     with st.spinner("Loading Map..."):
-        fig = generate_map_fap_functionalities(selected_state, selected_fap_functionality, data, state_gdf, state_geojson_data)
-        col1.plotly_chart(fig, use_container_width=True)
-
-    # Display counts in DataFrame
+        if filter_in_browser:
+            fig = cached_figure(("functionalities", selected_state, "browser filter"), selected_state,
+                                lambda: add_category_filter_menu(generate_map_fap_functionalities(selected_state, 'All', selection_index, state_gdf, state_geojson_data), "FAP Functionality"))
+        else:
+            fig = cached_figure(("functionalities", selected_state, selected_fap_functionality), selected_state,
+                                lambda: generate_map_fap_functionalities(selected_state, selected_fap_functionality, selection_index, state_gdf, state_geojson_data))
+        with stage("chart"):
+            col1.plotly_chart(fig, use_container_width=True)
+
+    # Display counts in DataFrame, rolled up from the aggregate cube
     col2.write(f"FAP Status Count - State Level")
-    if selected_state != 'All':
-        filtered_data = data[(data['STATE'] == selected_state) & ((data['FAP_FUNCTIONALITY'] == selected_fap_functionality) | (selected_fap_functionality == 'All'))]
-        counts_by_state = filtered_data.groupby('STATE')['FAP_FUNCTIONALITY'].value_counts().unstack(fill_value=0)
-        col2.table(counts_by_state)
-    else:
-        counts_by_state = data.groupby('STATE')['FAP_FUNCTIONALITY'].value_counts().unstack(fill_value=0)
-        col2.table(counts_by_state)
+    with stage("load"):
+        aggregate_cube = load_aggregate_cube(CSV_PATH)
+    with stage("table"):
+        if selected_state != 'All':
+            state_cells = aggregate_cube.rollup(['STATE', 'FAP_FUNCTIONALITY'], {'STATE': selected_state, 'FAP_FUNCTIONALITY': selected_fap_functionality})
+            counts_by_state = state_cells['count'].unstack(fill_value=0)
+            col2.table(counts_by_state)
+        else:
+            counts_by_state = aggregate_cube.rollup(['STATE', 'FAP_FUNCTIONALITY'])['count'].unstack(fill_value=0)
+            col2.table(counts_by_state)
 
 
 # Define page 2 content
 def page2():
+    from fap_assets import cached_figure, load_selection_index, load_state_gdf, load_state_geojson
+    from fap_data import CSV_PATH, MAP_COLUMNS
+    from fap_geo import STATE_GEOJSON_PATH
+    from fap_maps import add_category_filter_menu, generate_map_fap_types
+
     st.sidebar.header("FAP TYPE VISUALIZATION")
     st.title("FAP TYPE VISUALIZATION")
     
-    # Define the file path
-    file_path = "A2F_FAP_v1.csv"
-
-    # Load data
-    data = load_data(file_path)
+    # Load the columns needed by the map, indexed by selection
+    with stage("load"):
+        selection_index = load_selection_index(CSV_PATH, MAP_COLUMNS)
+        data = selection_index.data
 
-    # Load GeoJSON data for state boundaries
-    state_geojson_data = load_state_geojson("ngaadmbndaadm1osgof20161215.geojson")
-
-    # Convert GeoJSON data to GeoDataFrame for state boundaries
-    state_gdf = gpd.GeoDataFrame.from_features(state_geojson_data["features"])
+        # Load GeoJSON data and the GeoDataFrame for state boundaries (shared across sessions)
+        state_geojson_data = load_state_geojson(STATE_GEOJSON_PATH)
+        state_gdf = load_state_gdf(STATE_GEOJSON_PATH)
 
     # Filter by state (if required)
     states = ['All'] + sorted(list(data['STATE'].unique()))
     selected_state = st.sidebar.selectbox("Select State", states)
 
-    # Filter by FAP type
-    fap_types = ['All'] + list(data['FAP_TYPE'].unique())
-    selected_fap_type = st.sidebar.selectbox("Select FAP Type", fap_types)
+    # Filter by FAP type, on the server or in the browser (each state's map built once with every type, switched with a map dropdown)
+    filter_in_browser = st.sidebar.checkbox("Filter FAP Type on the map", help="Switch FAP type from a dropdown on the map, without reloading it")
+    if filter_in_browser:
+        selected_fap_type = 'All'
+    else:
+        fap_types = ['All'] + list(data['FAP_TYPE'].unique())
+        selected_fap_type = st.sidebar.selectbox("Select FAP Type", fap_types)
+    annotate(state=selected_state, fap_type=selected_fap_type, filter_in_browser=filter_in_browser)
 
     # Display the map
     with st.spinner("Loading Map..."):
-        fig = generate_map_fap_types(selected_state, selected_fap_type, data, state_gdf, state_geojson_data)
-        st.plotly_chart(fig, use_container_width=True)
+        if filter_in_browser:
+            fig = cached_figure(("types", selected_state, "browser filter"), selected_state,
+                                lambda: add_category_filter_menu(generate_map_fap_types(selected_state, 'All', selection_index, state_gdf, state_geojson_data), "FAP Type"))
+        else:
+            fig = cached_figure(("types", selected_state, selected_fap_type), selected_state,
+                                lambda: generate_map_fap_types(selected_state, selected_fap_type, selection_index, state_gdf, state_geojson_data))
+        with stage("chart"):
+            st.plotly_chart(fig, use_container_width=True)
 
 
 
 # Define page 3 content
 def page3():
- # Load GeoJSON data for state boundaries
-    state_geojson_data = load_state_geojson("ngaadmbndaadm1osgof20161215.geojson")
-
-    # Convert GeoJSON data to GeoDataFrame for state boundaries
-    state_gdf = gpd.GeoDataFrame.from_features(state_geojson_data["features"])
-
-    # Load data
-    file_path = "A2F_FAP_v1.csv"  # Replace with your actual dataset file path
-    data = load_data(file_path)
-
-    # Get unique FAP types
-    fap_types = data['FAP_TYPE'].unique().tolist()
+    from fap_assets import cached_figure, load_aggregate_cube, load_coverage, load_ea_proximity, load_state_gdf, load_state_geojson
+    from fap_coverage import COVERAGE_RESOLUTIONS_KM
+    from fap_data import CSV_PATH
+    from fap_geo import STATE_GEOJSON_PATH
+    from fap_maps import calculate_average_proximity, generate_km_diff_heatmap, generate_map_coverage
+
+    with stage("load"):
+        # Load GeoJSON data and the GeoDataFrame for state boundaries (shared across sessions)
+        state_geojson_data = load_state_geojson(STATE_GEOJSON_PATH)
+        state_gdf = load_state_gdf(STATE_GEOJSON_PATH)
+
+        # Load the aggregate cube the heatmap and the proximity table are rolled up from
+        aggregate_cube = load_aggregate_cube(CSV_PATH)
+
+    # Choose between the surveyed FAP-to-EA distance, the distance from each EA to its nearest FAP and the distance
+    # to the nearest FAP over a grid of the state
+    proximity_modes = ["Surveyed FAP distance", "Nearest FAP to EA", "Coverage grid"]
+    selected_proximity_mode = st.sidebar.radio("Select Proximity Metric", proximity_modes)
+
+    # Get unique FAP types (the coverage grid can measure the distance to any FAP)
+    fap_types = aggregate_cube.values('FAP_TYPE')
+    if selected_proximity_mode == "Coverage grid":
+        fap_types.insert(0, "All")
     selected_fap_type = st.sidebar.selectbox("Select FAP Type", fap_types)
 
     # Get unique states
-    states = data['STATE'].unique().tolist()
+    states = aggregate_cube.values('STATE')
     states.insert(0, "All")
     selected_state = st.sidebar.selectbox("Select State", states)
 
+    annotate(state=selected_state, fap_type=selected_fap_type, proximity_mode=selected_proximity_mode)
+
+    # Coverage grid of the selected state: distance to the nearest FAP of every grid cell, with the share of the
+    # state's area within reach of a FAP
+    if selected_proximity_mode == "Coverage grid":
+        active_only = st.sidebar.checkbox("Active FAPs only")
+        resolution_km = st.sidebar.selectbox("Select Grid Resolution (km)", COVERAGE_RESOLUTIONS_KM)
+        if selected_state == "All":
+            st.info("Select a state to see its coverage grid.")
+            return
+        with stage("load"):
+            surface = load_coverage(CSV_PATH, selected_state, selected_fap_type, active_only, resolution_km)
+        if surface is None:
+            st.info(f"No boundary found for {selected_state} state.")
+            return
+
+        col1, col2 = st.columns([9, 3])
+        with col1:
+            with st.spinner("Loading Coverage Grid..."):
+                fig = cached_figure(("coverage", selected_state, selected_fap_type, active_only, resolution_km), 'All',
+                                    lambda: generate_map_coverage(selected_state, selected_fap_type, active_only, surface))
+                with stage("chart"):
+                    st.plotly_chart(fig, use_container_width=True)
+        with col2:
+            st.markdown(f"### Coverage of {selected_state} state")
+            shares = surface.share_within()
+            st.table({"Within": [f"{km:g} km" for km in shares], "Share of area": [f"{share:.1%}" for share in shares.values()]})
+        return
+    if selected_proximity_mode == "Nearest FAP to EA":
+        with stage("load"):
+            ea_proximity_data = load_ea_proximity(CSV_PATH, selected_fap_type)
+    else:
+        ea_proximity_data = None
+
     # Display the heatmap
     if selected_state == "All":
-        fig = generate_km_diff_heatmap(state_gdf, state_geojson_data, data, selected_fap_type)
-        st.plotly_chart(fig, use_container_width=True)
+        fig = cached_figure(("km_diff", "All", selected_fap_type, selected_proximity_mode), "All",
+                            lambda: generate_km_diff_heatmap(state_gdf, state_geojson_data, aggregate_cube, selected_fap_type, ea_proximity_data=ea_proximity_data))
+        with stage("chart"):
+            st.plotly_chart(fig, use_container_width=True)
     else:
         col1, col2 = st.columns([9, 3])
         with col1:
             with st.spinner("Loading Average KM Diff Heatmap..."):
-                fig = generate_km_diff_heatmap(state_gdf, state_geojson_data, data, selected_fap_type, selected_state)
-                st.plotly_chart(fig, use_container_width=True)
-
-        # Filter data for selected state
-        selected_state_data = data[data['STATE'] == selected_state]
-        
-        # Calculate Average Proximity for each EA in the selected state and FAP type
-        avg_proximity_per_ea = calculate_average_proximity(selected_state_data, selected_fap_type)
-        
-        # Display unique EAs and their calculated average proximity
-        with col2:
-            st.markdown(f"### FAP Proximity by EA in {selected_state} state")
-            st.table(avg_proximity_per_ea)
+                # A state's nearest FAP can be across its border, so the nearest-FAP heatmap follows every batch
+                version_state = selected_state if ea_proximity_data is None else 'All'
+                fig = cached_figure(("km_diff", selected_state, selected_fap_type, selected_proximity_mode), version_state,
+                                    lambda: generate_km_diff_heatmap(state_gdf, state_geojson_data, aggregate_cube, selected_fap_type, selected_state, ea_proximity_data))
+                with stage("chart"):
+                    st.plotly_chart(fig, use_container_width=True)
+
+        with stage("table"):
+            if ea_proximity_data is None:
+                # Calculate Average Proximity for each EA in the selected state and FAP type
+                avg_proximity_per_ea = calculate_average_proximity(aggregate_cube, selected_state, selected_fap_type)
+            else:
+                # Nearest-FAP distance, mean of the nearest FAPs and FAP count nearby for each EA in the selected state
+                avg_proximity_per_ea = ea_proximity_data[ea_proximity_data['STATE'] == selected_state].drop(columns='STATE').reset_index(drop=True)
+
+            # Display unique EAs and their calculated average proximity
+            with col2:
+                st.markdown(f"### FAP Proximity by EA in {selected_state} state")
+                st.table(avg_proximity_per_ea)
+
+# Define page 4 content
+def page4():
+    from fap_assets import cached_figure, load_location_checks
+    from fap_data import CSV_PATH
+    from fap_maps import generate_map_location_checks
+    from fap_quality import LOCATION_CHECKS, quality_report
+
+    st.sidebar.header("FAP LOCATION QUALITY")
+    st.title("FAP LOCATION QUALITY")
+
+    # Survey state, EA and FAP location of every FAP checked against the state and EA polygons its coordinates fall in
+    with stage("load"):
+        location_checks = load_location_checks(CSV_PATH)
+
+    # Filter by state and location check
+    states = ['All'] + sorted(list(location_checks['STATE'].unique()))
+    selected_state = st.sidebar.selectbox("Select State", states)
+    selected_check = st.sidebar.radio("Select Location Check", ['All'] + list(LOCATION_CHECKS))
+    annotate(state=selected_state, location_check=selected_check)
+
+    # Display the map
+    with st.spinner("Loading Map..."):
+        fig = cached_figure(("location_checks", selected_state, selected_check), selected_state,
+                            lambda: generate_map_location_checks(selected_state, selected_check, location_checks))
+        with stage("chart"):
+            st.plotly_chart(fig, use_container_width=True)
+
+    # Display the FAP counts by location check, and the FAPs of the selected state and check
+    with stage("table"):
+        report = quality_report(location_checks)
+        if selected_state != 'All':
+            report = report.loc[[selected_state, 'Total']]
+        st.markdown("### FAP Location Checks by State")
+        st.dataframe(report, use_container_width=True)
+
+        flagged = location_checks
+        if selected_state != 'All':
+            flagged = flagged[flagged['STATE'] == selected_state]
+        if selected_check != 'All':
+            flagged = flagged[flagged['LOCATION CHECK'] == selected_check]
+        else:
+            flagged = flagged[flagged['LOCATION CHECK'] != 'OK']
+        st.markdown(f"### FAPs Failing a Location Check ({len(flagged)})" if selected_check != 'OK' else f"### FAPs Passing Every Location Check ({len(flagged)})")
+        st.dataframe(flagged.drop(columns=['FAP_TYPE', 'FORMALITY', 'FAP_FUNCTIONALITY']), use_container_width=True, hide_index=True)
 
 # Render selected page based on selection in the sidebar
-selected_page = st.sidebar.radio("Select Page", ["FAP Status Visualization", "FAP Type Visualization", "FAP Proximity Visualization"])
+selected_page = st.sidebar.radio("Select Page", ["FAP Status Visualization", "FAP Type Visualization", "FAP Proximity Visualization", "FAP Location Quality"])
 
+start_profile(selected_page)
 if selected_page == "FAP Status Visualization":
     page1()
 elif selected_page == "FAP Type Visualization":
     page2()
 elif selected_page == "FAP Proximity Visualization":
     page3()
+elif selected_page == "FAP Location Quality":
+    page4()
+profile = finish_profile()
+
+# Show the timings of this rerun in the sidebar when diagnostics are enabled
+if diagnostics_enabled():
+    from fap_assets import load_figure_cache
+    show_diagnostics(profile, load_figure_cache())
@@ -0,0 +1,308 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import geopandas as gpd
+import numpy as np
+import plotly.io as pio
+import shapely
+import streamlit as st
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Figures are serialized with plotly's JSON encoder instead
+
+from fap_data import (CSV_PATH, CUBE_COLUMNS, AggregateCube, SelectionIndex, base_version, data_version, read_base_data, read_batch,
+                      read_fap_data, read_ingest_log, shared_dir, state_version)
+from fap_geo import (GEO_BUNDLE_PATH, GEOMETRY_LEVELS, POLYGONS_DIR, STATE_GEOJSON_PATH, GeoBundle, bundle_is_fresh, ea_outline_coordinates,
+                     geometry_level, polygon_path, read_geojson, simplify_geometries, state_gdf_from_geojson)
+from fap_profiling import count, stage
+from fap_quality import QUALITY_COLUMNS, check_locations, ea_polygon_index, state_polygon_index
+from fap_tiles import tile_url
+from figure_cache import FigureCache
+
+logger = logging.getLogger("a2f.assets")
+
+# Shared assets of the app: the survey data and everything derived from it, the geo assets and the rendered
+# figures. Each is built once per process (st.cache_resource) and shared read-only by every session. With the
+# shared data plane on (A2F_SHARED_DIR, see fap_shared), the survey data, the state boundaries and the location
+# checks are published once for every process on the machine and attached zero-copy.
+
+# Function to publish a dataset version in the shared data plane (building it the first time) and attach it once per process
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _attach_shared(dataset, version, _build_table):
+    from fap_shared import attach, publish
+    return attach(publish(dataset, version, _build_table))
+
+# Function to get a short name part for a dataset version stamp (a tuple of file versions)
+def version_key(*versions):
+    return hashlib.sha1(repr(versions).encode("utf-8")).hexdigest()[:12]
+
+# Function to read columns of the survey data with the ingested batches applied: attached from the shared data
+# plane when it is on (read-only, string columns as categoricals), read from disk otherwise
+def read_survey_data(file_path, columns, version):
+    if not shared_dir():
+        return read_fap_data(file_path, columns)
+    from fap_shared import frame_to_table, table_to_frame
+    dataset = os.path.splitext(os.path.basename(file_path))[0]
+    return table_to_frame(_attach_shared(dataset, version, lambda: frame_to_table(read_fap_data(file_path))), columns)
+
+@st.cache_data
+def _load_data(file_path, columns, version):
+    return read_fap_data(file_path, columns)
+
+# Function to load the survey data (columnar store when built, CSV otherwise) with the ingested batches applied,
+# optionally only some columns. Shared data plane frames are returned as they are, not copied per call.
+def load_data(file_path, columns=None):
+    version = data_version(file_path)
+    if shared_dir():
+        return read_survey_data(file_path, columns, version)
+    return _load_data(file_path, columns, version)
+
+# Function to drop the cached copies of the survey data
+def clear_data_cache():
+    _load_data.clear()
+
+# Function to build the selection index over the survey data once per process and per data version (read-only)
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _load_selection_index(file_path, columns, version):
+    return SelectionIndex(read_survey_data(file_path, columns, version))
+
+# Function to load the selection index over the given columns of the survey data
+def load_selection_index(file_path, columns):
+    return _load_selection_index(file_path, columns, data_version(file_path))
+
+# Function to build the aggregate cube over the survey data with its first batch_count ingested batches once per
+# process (read-only). A new batch is applied to the cube of the batches before it, reading only the batch files.
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_aggregate_cube(file_path, version, batch_count):
+    if batch_count == 0:
+        return AggregateCube(read_base_data(file_path, CUBE_COLUMNS))
+    added, replaced = read_batch(file_path, read_ingest_log(file_path)[batch_count - 1], CUBE_COLUMNS)
+    return _load_aggregate_cube(file_path, version, batch_count - 1).upsert(replaced, added)
+
+# Function to load the aggregate cube of the survey data
+def load_aggregate_cube(file_path):
+    return _load_aggregate_cube(file_path, base_version(file_path), len(read_ingest_log(file_path)))
+
+# Function to build the nearest-FAP spatial index and the EA centroids once per process and per data version (read-only)
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_nearest_fap_index(file_path, version):
+    from fap_proximity import NEAREST_COLUMNS, NearestFapIndex, ea_centroids  # scipy is only needed by the nearest-FAP mode
+    data = read_survey_data(file_path, NEAREST_COLUMNS, version)
+    return NearestFapIndex(data), ea_centroids(data)
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _load_ea_proximity(file_path, version, fap_type):
+    from fap_proximity import ea_proximity
+    nearest_fap_index, eas = _load_nearest_fap_index(file_path, version)
+    return ea_proximity(nearest_fap_index, eas, fap_type)
+
+# Function to load the nearest-FAP proximity of every EA in the country for a FAP type
+def load_ea_proximity(file_path, fap_type):
+    return _load_ea_proximity(file_path, data_version(file_path), fap_type)
+
+# Function to compute the coverage surface of a state once per process, data and boundary version (read-only)
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _load_coverage(file_path, version, state_file_version, selected_state, fap_type, active_only, resolution_km):
+    from fap_coverage import coverage_surface
+    nearest_fap_index, _ = _load_nearest_fap_index(file_path, version)
+    state_gdf = _load_state_gdf(STATE_GEOJSON_PATH, state_file_version)
+    state_polygons = state_gdf.geometry[state_gdf['admin1Name'] == selected_state]
+    if state_polygons.empty:
+        return None
+    return coverage_surface(shapely.force_2d(state_polygons.values[0]), nearest_fap_index, fap_type, active_only, resolution_km)
+
+# Function to load the coverage surface of a state (None for a state without boundary): the distance to the nearest
+# FAP of a type (active ones only, optionally) of every grid cell of resolution_km. FAPs across the state's border
+# count, so the surface follows every batch of the data.
+def load_coverage(file_path, selected_state, fap_type, active_only=False, resolution_km=1):
+    return _load_coverage(file_path, data_version(file_path), file_version(STATE_GEOJSON_PATH), selected_state, fap_type, active_only, resolution_km)
+
+# Function to get a version stamp for a file on disk (changes when the file is replaced or edited)
+def file_version(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+# Function to parse a GeoJSON file once per process and per file version.
+# The returned object is shared by every session, so callers must treat it as read-only.
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _load_geojson(file_path, version):
+    return read_geojson(file_path)
+
+# Function to build the state boundaries GeoDataFrame once per process and per file version (read-only),
+# with the centroid of every state precomputed in the centroid_lat / centroid_lon columns
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_state_gdf(file_path, version):
+    if shared_dir():
+        from fap_shared import gdf_to_table, table_to_gdf
+        return table_to_gdf(_attach_shared("states", version_key(version), lambda: gdf_to_table(state_gdf_from_geojson(read_geojson(file_path)))))
+    return state_gdf_from_geojson(_load_geojson(file_path, version))
+
+# Function to build the simplified state boundaries of every level of detail once per process (read-only)
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_state_geometries(file_path, version):
+    geometry = _load_state_gdf(file_path, version).geometry
+    return [gpd.GeoSeries(simplify_geometries(geometry.values, level), index=geometry.index, crs=geometry.crs)
+            for level in range(len(GEOMETRY_LEVELS))]
+
+# Function to load the state boundaries simplified for a map zoom
+def load_state_geometry(file_path, zoom_level):
+    return _load_state_geometries(file_path, file_version(file_path))[geometry_level(zoom_level)]
+
+# Function to load GeoJSON data for state boundaries
+def load_state_geojson(file_path):
+    return _load_geojson(file_path, file_version(file_path))
+
+# Function to load the GeoDataFrame for state boundaries
+def load_state_gdf(file_path):
+    return _load_state_gdf(file_path, file_version(file_path))
+
+# Function to get a version stamp of the geo assets a state's map is drawn from (state boundaries and EA polygons)
+def geo_version(selected_state):
+    if load_geo_bundle() is not None:
+        ea_version = file_version(GEO_BUNDLE_PATH)
+    elif selected_state != 'All' and os.path.exists(polygon_path(selected_state)):
+        ea_version = file_version(polygon_path(selected_state))
+    else:
+        ea_version = None
+    return file_version(STATE_GEOJSON_PATH), ea_version
+
+# Function to memory-map the geo asset bundle once per process and per file version (read-only), or None when the
+# file is not a bundle this version of the app reads (e.g. built with other levels of detail)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _load_geo_bundle(file_path, version):
+    try:
+        return GeoBundle(file_path)
+    except ValueError as error:
+        logger.warning("Reading the GeoJSON files instead of the geo asset bundle: %s", error)
+        return None
+
+# Function to load the geo asset bundle, or None when it has not been built (python fap_geo.py), is older than the
+# GeoJSON files it was built from or cannot be read: the GeoJSON files are read instead then
+def load_geo_bundle():
+    if not bundle_is_fresh():
+        return None
+    return _load_geo_bundle(GEO_BUNDLE_PATH, file_version(GEO_BUNDLE_PATH))
+
+# Function to load GeoJSON data for polygons based on selected state (from the bundle index when built)
+def load_polygon_geojson_selected_state(selected_state):
+    bundle = load_geo_bundle()
+    if bundle is not None:
+        return bundle.ea_geojson(selected_state)
+    file_path = polygon_path(selected_state)
+    return _load_geojson(file_path, file_version(file_path))
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _load_ea_outlines(file_path, version, level):
+    return ea_outline_coordinates(_load_geojson(file_path, version), level)
+
+# Function to load the batched EA outline coordinates (lats, lons) for the selected state, simplified for a map zoom.
+# With the geo asset bundle this is an index lookup returning views into the memory-mapped file.
+def load_ea_outlines_selected_state(selected_state, zoom_level):
+    bundle = load_geo_bundle()
+    if bundle is not None:
+        return bundle.ea_outlines(selected_state, geometry_level(zoom_level))
+    file_path = polygon_path(selected_state)
+    if not os.path.exists(file_path):
+        return np.empty(0), np.empty(0)  # State without EA polygons
+    return _load_ea_outlines(file_path, file_version(file_path), geometry_level(zoom_level))
+
+# Function to get a version stamp of the EA polygons of every state (the bundle when built, the polygon files otherwise)
+def ea_polygons_version():
+    if load_geo_bundle() is not None:
+        return file_version(GEO_BUNDLE_PATH)
+    return tuple(file_version(path) for path in sorted(glob.glob(os.path.join(POLYGONS_DIR, "*.geojson"))))
+
+# Function to check the location of every FAP against the state and EA polygons once per process, per data version
+# and per geo asset version (read-only): the survey columns of QUALITY_COLUMNS joined with the check results
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_location_checks(file_path, version, state_version, ea_version):
+    def build_location_checks():
+        state_gdf = load_state_gdf(STATE_GEOJSON_PATH)
+        bundle = load_geo_bundle()
+        polygon_geojson_by_state = {state_name: load_polygon_geojson_selected_state(state_name) for state_name in state_gdf['admin1Name']
+                                    if bundle is not None or os.path.exists(polygon_path(state_name))}
+        data = read_survey_data(file_path, QUALITY_COLUMNS, version)
+        return data.join(check_locations(data, state_polygon_index(state_gdf), ea_polygon_index(polygon_geojson_by_state)))
+
+    if shared_dir():
+        from fap_shared import frame_to_table, table_to_frame
+        dataset = f"{os.path.splitext(os.path.basename(file_path))[0]}.location_checks"
+        return table_to_frame(_attach_shared(dataset, version_key(version, state_version, ea_version), lambda: frame_to_table(build_location_checks())))
+    return build_location_checks()
+
+# Function to load the location checks of every FAP (see fap_quality)
+def load_location_checks(file_path):
+    return _load_location_checks(file_path, data_version(file_path), file_version(STATE_GEOJSON_PATH), ea_polygons_version())
+
+# Memory budget of the rendered figure cache shared by all sessions
+FIGURE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# Function to get the process-wide cache of rendered figures
+@st.cache_resource(show_spinner=False)
+def load_figure_cache():
+    return FigureCache(FIGURE_CACHE_MAX_BYTES)
+
+# Function to get a version stamp of the survey rows a figure of the selected state is drawn from: ingesting a
+# batch changes the stamp of the states it touched (and of the national figures) only
+def selection_version(selected_state):
+    if selected_state in (None, 'All'):
+        return data_version(CSV_PATH)
+    return state_version(CSV_PATH, selected_state)
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()  # Arrays orjson does not encode natively (strided views, objects)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__} to JSON")
+
+# Function to serialize a figure (plain dict) to JSON. orjson encodes the NumPy arrays of the traces natively,
+# without converting them to lists first; plotly's encoder is used when orjson is not installed.
+def figure_to_json(fig):
+    if orjson is None:
+        return pio.to_json(fig, validate=False)
+    return orjson.dumps(fig, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+# Function to parse a figure JSON back into a plain dict
+def figure_from_json(figure_json):
+    return orjson.loads(figure_json) if orjson is not None else json.loads(figure_json)
+
+# Function to get a map figure (as a plain dict) for a sidebar selection of the selected state, rebuilding it
+# only when the selection has not been rendered for the current version of the state's data and geo files yet
+def cached_figure(selection, selected_state, build_figure):
+    figure_cache = load_figure_cache()
+    # Selections are (map kind, state shown, ...): the geo files of the state shown draw its base layers, and tile
+    # maps reference the tiles of a version
+    key = selection + (selection_version(selected_state), geo_version(selection[1]), tile_url())
+    figure_json = figure_cache.get(key)
+    if figure_json is None:
+        count("figure_cache_miss")
+        with stage("figure"):
+            fig = build_figure()
+        with stage("serialize"):
+            figure_json = figure_to_json(fig)
+        figure_cache.put(key, figure_json)
+    else:
+        count("figure_cache_hit")
+    count("payload_bytes", len(figure_json))
+    with stage("deserialize"):
+        return figure_from_json(figure_json)
+
+# Function to drop every shared geo asset and everything built from them (map base layers, location checks,
+# coverage surfaces, rendered figures), e.g. after the GeoJSON files were replaced on disk
+def clear_geo_cache():
+    from fap_maps import _load_base_layers  # The map base layers are drawn from the geo assets (fap_maps imports this module)
+    _load_base_layers.clear()
+    _load_geojson.clear()
+    _load_state_gdf.clear()
+    _load_state_geometries.clear()
+    _load_ea_outlines.clear()
+    _load_geo_bundle.clear()
+    _load_location_checks.clear()
+    _load_coverage.clear()
+    load_figure_cache().clear()
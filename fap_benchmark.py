@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import geopandas as gpd
+import pandas as pd
+import streamlit.logger
+
+streamlit.logger.set_log_level("ERROR")  # The cached loaders run without a Streamlit runtime here
+
+from fap_assets import (_load_geojson, clear_data_cache, figure_to_json, load_aggregate_cube, load_data, load_ea_proximity,
+                        load_selection_index, load_state_gdf, load_state_geojson)
+from fap_data import CSV_PATH, MAP_COLUMNS
+from fap_geo import STATE_GEOJSON_PATH
+from fap_maps import (calculate_average_proximity, generate_km_diff_heatmap, generate_map_fap_functionalities, generate_map_fap_types,
+                      load_base_layers)
+from fap_synthetic import synthetic_path, write_synthetic_csv
+
+# Benchmarks of the loaders and page renderers of the app, run without a browser: every function is timed over
+# every state and every filter value the pages offer, reporting wall time, peak Python memory (tracemalloc) and
+# the size of the serialized figure. Run at larger scales on synthetic copies of the survey data (fap_synthetic.py).
+
+PROXIMITY_MODES = ("Surveyed FAP distance", "Nearest FAP to EA")
+
+# Function to time a call (best of repeat runs) and measure its peak memory in one more run under tracemalloc.
+# setup runs before every call, untimed (e.g. to clear a cache so the call is cold).
+def measure(call, setup=None, repeat=1, memory=True):
+    seconds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = call()
+        seconds.append(time.perf_counter() - started)
+    peak_bytes = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            call()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, min(seconds), peak_bytes
+
+# Function to get the serialized size in bytes of a figure, as sent to the browser
+def figure_size(fig):
+    return len(figure_to_json(fig).encode("utf-8"))
+
+# Function to list the benchmark cases for a survey data file as (function, case, call, setup, is_figure)
+def benchmark_cases(file_path, states=None):
+    state_geojson_data = load_state_geojson(STATE_GEOJSON_PATH)
+    state_gdf = load_state_gdf(STATE_GEOJSON_PATH)
+    selection_index = load_selection_index(file_path, MAP_COLUMNS)
+    aggregate_cube = load_aggregate_cube(file_path)
+    all_states = sorted(selection_index.data['STATE'].unique())
+    states = [state for state in all_states if state in states] if states else all_states
+    fap_types = aggregate_cube.values('FAP_TYPE')
+
+    # Loaders, timed cold (only the GeoJSON loader's cache is cleared: clear_geo_cache would also drop the base layers
+    # run_benchmarks builds up front)
+    yield "load_data", "all columns", lambda: load_data(file_path), clear_data_cache, False
+    yield "load_state_geojson", "states", lambda: load_state_geojson(STATE_GEOJSON_PATH), _load_geojson.clear, False
+    yield "GeoDataFrame.from_features", "states", lambda: gpd.GeoDataFrame.from_features(state_geojson_data["features"]), None, False
+
+    # Page renderers, timed with the shared assets loaded (the cost of switching a filter)
+    for selected_state in ['All'] + states:
+        for selected_fap_functionality in ['All', 'Active', 'Inactive']:
+            yield ("generate_map_fap_functionalities", f"{selected_state} / {selected_fap_functionality}",
+                   lambda s=selected_state, f=selected_fap_functionality: generate_map_fap_functionalities(s, f, selection_index, state_gdf, state_geojson_data),
+                   None, True)
+        for selected_fap_type in ['All'] + fap_types:
+            yield ("generate_map_fap_types", f"{selected_state} / {selected_fap_type}",
+                   lambda s=selected_state, t=selected_fap_type: generate_map_fap_types(s, t, selection_index, state_gdf, state_geojson_data),
+                   None, True)
+        for selected_fap_type in fap_types:
+            for proximity_mode in PROXIMITY_MODES:
+                ea_proximity_data = load_ea_proximity(file_path, selected_fap_type) if proximity_mode == "Nearest FAP to EA" else None
+                yield ("generate_km_diff_heatmap", f"{selected_state} / {selected_fap_type} / {proximity_mode}",
+                       lambda s=selected_state, t=selected_fap_type, p=ea_proximity_data: generate_km_diff_heatmap(state_gdf, state_geojson_data, aggregate_cube, t, None if s == 'All' else s, p),
+                       None, True)
+            if selected_state != 'All':
+                yield ("calculate_average_proximity", f"{selected_state} / {selected_fap_type}",
+                       lambda s=selected_state, t=selected_fap_type: calculate_average_proximity(aggregate_cube, s, t),
+                       None, False)
+
+# Function to run every benchmark case on a survey data file, returning one record per case
+def run_benchmarks(file_path, states=None, repeat=1, memory=True):
+    # Build the static base layers up front, so the renderers are timed on the per-request work only
+    for selected_state in ['All'] + sorted(load_selection_index(file_path, MAP_COLUMNS).data['STATE'].unique()):
+        load_base_layers(selected_state)
+
+    records = []
+    for function, case, call, setup, is_figure in benchmark_cases(file_path, states):
+        result, seconds, peak_bytes = measure(call, setup, repeat, memory)
+        encode_seconds = measure(lambda: figure_to_json(result), None, repeat, False)[1] if is_figure else None
+        records.append(dict(function=function, case=case, seconds=seconds, peak_bytes=peak_bytes,
+                            size_bytes=figure_size(result) if is_figure else None, encode_seconds=encode_seconds))
+    return records
+
+# Function to summarize benchmark records per function: number of cases, total/mean/max wall time,
+# highest peak memory, mean/max serialized figure size and mean serialization time
+def summarize(records):
+    results = pd.DataFrame(records)
+    summary = results.groupby(['scale', 'function'], sort=False).agg(
+        cases=('case', 'size'),
+        total_s=('seconds', 'sum'),
+        mean_ms=('seconds', lambda seconds: seconds.mean() * 1000),
+        max_ms=('seconds', lambda seconds: seconds.max() * 1000),
+        peak_mb=('peak_bytes', lambda peak: peak.max() / 2 ** 20),
+        mean_kb=('size_bytes', lambda size: size.mean() / 1024),
+        max_kb=('size_bytes', lambda size: size.max() / 1024),
+        encode_ms=('encode_seconds', lambda seconds: seconds.mean() * 1000),
+    )
+    return summary.round(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the loaders and page renderers of the app on the survey data and synthetic copies of it.")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1], help="Scale factors to run at (1 is the survey data, e.g. 1 10 100 1000)")
+    parser.add_argument("--states", nargs="+", default=None, help="Only these states (default: all of them)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the extra run per case measuring peak memory")
+    parser.add_argument("--output", default=None, help="Write every record to this JSON file")
+    args = parser.parse_args()
+
+    records = []
+    for scale in args.scales:
+        file_path = CSV_PATH
+        if scale != 1:
+            file_path = synthetic_path(CSV_PATH, scale)
+            if not os.path.exists(file_path):
+                print(f"Writing {file_path}")
+                write_synthetic_csv(scale, CSV_PATH, file_path)
+        for record in run_benchmarks(file_path, args.states, args.repeat, not args.no_memory):
+            records.append(dict(record, scale=scale))
+
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summarize(records))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=1)
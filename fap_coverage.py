@@ -0,0 +1,92 @@
+import base64
+import struct
+import zlib
+
+import numpy as np
+import plotly.colors
+import shapely
+
+from fap_geo import KM_PER_DEGREE
+
+# Coverage surface of a state: the distance from the centre of every cell of a regular grid over the state's
+# bounding box to the nearest FAP (of a type, optionally active ones only), masked to the state polygon. The
+# distances of all cells are one bulk k-d tree query (fap_proximity), so a 1 km grid of the largest state takes
+# well under a second. The surface is drawn on the map as a PNG image layer over the state.
+
+# Grid cell sizes offered, in km
+COVERAGE_RESOLUTIONS_KM = (1, 2, 5)
+
+# Distances the colour scale spans: cells this far from a FAP or further get the last colour
+COVERAGE_MAX_KM = 20
+
+# Distances the share of a state's area within reach of a FAP is reported for
+COVERAGE_THRESHOLDS_KM = (1, 2, 5, 10)
+
+# Colour scale of the surface (near FAPs light, far from FAPs dark) and its opacity on the map
+COVERAGE_COLORSCALE = "YlOrRd"
+COVERAGE_OPACITY = 0.75
+
+# Distance to the nearest FAP of the cells of a grid, rows from north to south (NaN outside the state)
+class CoverageSurface:
+    def __init__(self, distances, bounds, resolution_km):
+        self.distances = distances
+        self.bounds = bounds  # (west, south, east, north) of the grid in degrees
+        self.resolution_km = resolution_km
+
+    # Function to get the coordinates of the cell centres of the grid as (lat, lon) arrays of its shape
+    def cell_coordinates(self):
+        west, south, east, north = self.bounds
+        rows, columns = self.distances.shape
+        lat = north - (np.arange(rows) + 0.5) * (north - south) / rows
+        lon = west + (np.arange(columns) + 0.5) * (east - west) / columns
+        return np.meshgrid(lat, lon, indexing="ij")
+
+    # Function to get the share of the state's area (its cells) within each distance of a FAP
+    def share_within(self, thresholds_km=COVERAGE_THRESHOLDS_KM):
+        inside = self.distances[~np.isnan(self.distances)]
+        return {km: float(np.mean(inside <= km)) if len(inside) else 0.0 for km in thresholds_km}
+
+# Function to compute the coverage surface of a state polygon: the distance from every grid cell inside it to the
+# nearest FAP of a type in the nearest-FAP index (FAPs of neighbouring states included)
+def coverage_surface(state_polygon, nearest_index, fap_type='All', active_only=False, resolution_km=1):
+    west, south, east, north = state_polygon.bounds
+
+    # Cells of about resolution_km on a side: degrees of longitude shrink with the cosine of the latitude
+    step_lat = resolution_km / KM_PER_DEGREE
+    step_lon = step_lat / np.cos(np.radians((south + north) / 2))
+    rows, columns = max(1, int(np.ceil((north - south) / step_lat))), max(1, int(np.ceil((east - west) / step_lon)))
+    bounds = (west, north - rows * step_lat, west + columns * step_lon, north)
+    surface = CoverageSurface(np.full((rows, columns), np.nan, dtype=np.float32), bounds, resolution_km)
+
+    # Distances of the cells whose centre lies in the state, in one query
+    lat, lon = surface.cell_coordinates()
+    shapely.prepare(state_polygon)
+    inside = shapely.contains_xy(state_polygon, lon, lat)
+    surface.distances[inside] = nearest_index.nearest_km(fap_type, lat[inside], lon[inside], active_only=active_only)[:, 0]
+    return surface
+
+# Function to encode an RGBA image (uint8 array of shape (rows, columns, 4)) as PNG
+def png_bytes(rgba):
+    rows, columns = rgba.shape[:2]
+    scanlines = np.concatenate((np.zeros((rows, 1), dtype=np.uint8), rgba.reshape(rows, columns * 4)), axis=1)  # Filter type 0 per row
+
+    def chunk(kind, payload):
+        return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", columns, rows, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)) + chunk(b"IEND", b""))
+
+# Function to colour distances by the coverage colour scale (0 to max_km), transparent outside the state
+def coverage_rgba(distances, max_km=COVERAGE_MAX_KM):
+    palette = plotly.colors.sample_colorscale(plotly.colors.get_colorscale(COVERAGE_COLORSCALE), np.linspace(0, 1, 256), colortype="tuple")
+    palette = np.round(np.asarray(palette) * 255).astype(np.uint8)  # Colours as 0-1 tuples
+    inside = ~np.isnan(distances)  # Cells without any FAP of the type (inf) get the last colour
+    levels = np.clip(np.nan_to_num(distances / max_km, posinf=1.0) * 255, 0, 255).astype(np.uint8)
+    rgba = np.zeros(distances.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = palette[levels]
+    rgba[..., 3] = np.where(inside, round(COVERAGE_OPACITY * 255), 0)
+    return rgba
+
+# Function to get the coverage surface as a PNG data URI, the source of a mapbox image layer
+def coverage_image_uri(surface, max_km=COVERAGE_MAX_KM):
+    return "data:image/png;base64," + base64.b64encode(png_bytes(coverage_rgba(surface.distances, max_km))).decode("ascii")
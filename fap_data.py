@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Survey data shipped with the app
+CSV_PATH = "A2F_FAP_v1.csv"
+
+# Low-cardinality survey columns stored as categoricals
+CATEGORICAL_COLUMNS = ['STATE', 'FAP_TYPE', 'FAP_FUNCTIONALITY', 'FORMALITY', 'GENDER']
+
+# Coordinate columns stored as float32 (about 5 cm of precision at Nigerian longitudes)
+COORDINATE_COLUMNS = ['EA.LATITUDE', 'EA.LONGITUDE', 'EA.Latitude', 'EA.Longitude', 'LATITUDE', 'LONGITUDE']
+
+# Columns each page of the app reads
+MAP_COLUMNS = ('STATE', 'FAP_FUNCTIONALITY', 'FAP_TYPE', 'FORMALITY', 'LATITUDE', 'LONGITUDE')
+
+# Distance from each FAP to its EA as surveyed, computed from the coordinate columns below where it is missing
+KM_DIFF_COLUMN = 'KM Diff Calculation'
+DISTANCE_COLUMNS = ('LATITUDE', 'LONGITUDE', 'EA.LATITUDE', 'EA.LONGITUDE')
+
+# Largest plausible FAP-to-EA distance in km (the surveyed distances all lie within it): computed distances beyond
+# it come from misplaced coordinates and are left missing, so they do not count in the averages
+MAX_KM_DIFF = 5.0
+
+# Distance formula used to fill KM_DIFF_COLUMN: "haversine" (sphere) or "ellipsoidal" (WGS84, Lambert's formula)
+DISTANCE_METHOD = "haversine"
+EARTH_RADIUS_KM = 6371.0088  # Mean Earth radius
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+
+# Dimensions of the aggregate cube, and the columns it is built from
+CUBE_DIMENSIONS = ('STATE', 'EA NAME', 'FAP_TYPE', 'FAP_FUNCTIONALITY', 'FORMALITY')
+CUBE_COLUMNS = CUBE_DIMENSIONS + (KM_DIFF_COLUMN,)
+
+# Survey rows are ingested in batches keyed by this column: a batch replaces every row of its instances
+INSTANCE_COLUMN = 'InstanceID'
+
+# Directory of the shared data plane (e.g. /dev/shm/a2f); unset, every process reads its own copy of the data
+SHARED_DIR_ENV = "A2F_SHARED_DIR"
+
+# Columns the selection index is keyed by, in key order
+SELECTION_KEYS = ('STATE', 'FAP_FUNCTIONALITY', 'FAP_TYPE')
+EMPTY_POSITIONS = np.empty(0, dtype=np.intp)
+
+# Function to get the path of the columnar store next to a CSV file
+def store_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+# Function to get the shared data plane directory (A2F_SHARED_DIR, see fap_shared), or None when the mode is off
+def shared_dir():
+    return os.environ.get(SHARED_DIR_ENV) or None
+
+# Function to get the directory holding the ingested batches of a survey CSV, e.g. A2F_FAP_v1.batches
+def batches_dir(csv_path):
+    return os.path.splitext(csv_path)[0] + ".batches"
+
+# Function to read the ingest log of a survey CSV: one entry per ingested batch, oldest first, with its
+# files and the states it touched (empty when nothing was ingested)
+def read_ingest_log(csv_path):
+    log_path = os.path.join(batches_dir(csv_path), "log.json")
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# Function to read one ingested batch: the rows it added and the rows it replaced, optionally only some columns
+def read_batch(csv_path, entry, columns=None):
+    columns = list(columns) if columns else None
+    directory = batches_dir(csv_path)
+    added = pd.read_parquet(os.path.join(directory, entry["added"]), columns=columns, engine="pyarrow")
+    replaced = pd.read_parquet(os.path.join(directory, entry["replaced"]), columns=columns, engine="pyarrow")
+    return added, replaced
+
+# Function to get the dtypes used for the survey columns
+def fap_dtypes():
+    dtypes = {column: "category" for column in CATEGORICAL_COLUMNS}
+    dtypes.update({column: "float32" for column in COORDINATE_COLUMNS})
+    return dtypes
+
+# Function to compute great-circle distances in km between arrays of coordinates (degrees), on a sphere
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=np.float64)) for values in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+# Function to compute distances in km between arrays of coordinates (degrees) on the WGS84 ellipsoid, with
+# Lambert's formula (within a few metres of Vincenty at survey distances, without iterating)
+def ellipsoidal_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=np.float64)) for values in (lat1, lon1, lat2, lon2))
+    beta1 = np.arctan((1 - WGS84_F) * np.tan(lat1))  # Reduced latitudes
+    beta2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    h = np.sin((beta2 - beta1) / 2) ** 2 + np.cos(beta1) * np.cos(beta2) * np.sin((lon2 - lon1) / 2) ** 2
+    sigma = 2 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))  # Central angle
+    p, q = (beta1 + beta2) / 2, (beta2 - beta1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        distance = WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
+    return np.where(sigma == 0, 0.0, distance)
+
+# Function to fill the missing FAP-to-EA distances of the whole frame in one pass (the whole column when the batch
+# has none), from the coordinates. Surveyed distances are kept; computed ones above MAX_KM_DIFF stay missing.
+def add_km_diff(data, method=DISTANCE_METHOD):
+    distance = haversine_km if method == "haversine" else ellipsoidal_km
+    km_diff = distance(data['LATITUDE'], data['LONGITUDE'], data['EA.LATITUDE'], data['EA.LONGITUDE'])
+    km_diff = np.where(km_diff <= MAX_KM_DIFF, km_diff, np.nan)
+    if KM_DIFF_COLUMN in data.columns:
+        km_diff = data[KM_DIFF_COLUMN].astype(np.float64).fillna(pd.Series(km_diff, index=data.index)).to_numpy()
+    data[KM_DIFF_COLUMN] = km_diff
+    return data
+
+# Function to read the survey CSV with compact dtypes and missing distances filled, optionally only some columns
+def read_fap_csv(csv_path, columns=None):
+    wanted = set(columns) | set(DISTANCE_COLUMNS) if columns else None
+    data = pd.read_csv(csv_path, usecols=(lambda column: column in wanted) if wanted else None, dtype=fap_dtypes(), encoding="utf-8-sig")
+    data = add_km_diff(data)
+    return data[list(columns)] if columns else data
+
+# Function to convert the survey CSV into the columnar store (missing distances are filled before storing)
+def convert_csv_to_store(csv_path, parquet_path=None):
+    parquet_path = parquet_path or store_path(csv_path)
+    read_fap_csv(csv_path).to_parquet(parquet_path, engine="pyarrow", index=False)
+    return parquet_path
+
+# Function to check that the columnar store exists and is not older than the CSV it was built from
+def store_is_fresh(csv_path, parquet_path=None):
+    parquet_path = parquet_path or store_path(csv_path)
+    if not os.path.exists(parquet_path):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+
+# Function to read the survey data as shipped, without ingested batches: from the columnar store when it is
+# up to date and from the CSV otherwise
+def read_base_data(csv_path, columns=None):
+    parquet_path = store_path(csv_path)
+    if store_is_fresh(csv_path, parquet_path):
+        try:
+            return pd.read_parquet(parquet_path, columns=list(columns) if columns else None, engine="pyarrow")
+        except ImportError:
+            pass  # pyarrow is not installed, fall back to the CSV
+    return read_fap_csv(csv_path, columns)
+
+# Function to read the survey data with every ingested batch applied, optionally only some columns. The rows of
+# an instance come from the latest batch holding it (or from the shipped data when no batch does).
+def read_fap_data(csv_path, columns=None):
+    log = read_ingest_log(csv_path)
+    if not log:
+        return read_base_data(csv_path, columns)
+    read_columns = list(dict.fromkeys(list(columns) + [INSTANCE_COLUMN])) if columns else None
+    parts = [read_base_data(csv_path, read_columns)] + [read_batch(csv_path, entry, read_columns)[0] for entry in log]
+    data = pd.concat([part.assign(_batch=number) for number, part in enumerate(parts)], ignore_index=True)
+    data = data[data['_batch'] == data.groupby(INSTANCE_COLUMN)['_batch'].transform('max')].drop(columns='_batch')
+    dtypes = {column: dtype for column, dtype in fap_dtypes().items() if column in data.columns}
+    data = data.astype(dtypes).reset_index(drop=True)
+    return data[list(columns)] if columns else data
+
+# Function to get a short hash identifying the survey data as shipped (CSV and columnar store) on disk
+def base_version(csv_path):
+    stamps = []
+    for path in (csv_path, store_path(csv_path)):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamps.append(f"{path}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha1("|".join(stamps).encode("utf-8")).hexdigest()[:12]
+
+# Function to get a short hash identifying the current version of the survey data, ingested batches included
+def data_version(csv_path):
+    batch_ids = [entry["id"] for entry in read_ingest_log(csv_path)]
+    return hashlib.sha1("|".join([base_version(csv_path)] + batch_ids).encode("utf-8")).hexdigest()[:12]
+
+# Function to get a short hash identifying the current version of one state's survey rows: it changes only when
+# the shipped data changes or a batch touching the state is ingested
+def state_version(csv_path, state):
+    batch_ids = [entry["id"] for entry in read_ingest_log(csv_path) if state in entry["states"]]
+    return hashlib.sha1("|".join([base_version(csv_path), state] + batch_ids).encode("utf-8")).hexdigest()[:12]
+
+
+# Row positions of every (STATE, FAP_FUNCTIONALITY, FAP_TYPE) selection, built once per data version.
+# Every combination of the three keys with 'All' wildcards is grouped up front, so a selection is a
+# dictionary lookup followed by a positional take instead of boolean masks over the whole frame.
+class SelectionIndex:
+    def __init__(self, data):
+        self.data = data
+        self.empty = data.iloc[:0]
+        self._positions = {(None, None, None): np.arange(len(data))}
+        for used in itertools.product([False, True], repeat=len(SELECTION_KEYS)):
+            keys = [key for key, use in zip(SELECTION_KEYS, used) if use]
+            if not keys:
+                continue
+            for values, positions in data.groupby(keys, observed=True, sort=False).indices.items():
+                values = iter(values if len(keys) > 1 else (values,))
+                self._positions[tuple(next(values) if use else None for use in used)] = positions
+
+    # Function to get the row positions of a selection ('All' or None matches every value)
+    def positions(self, state='All', functionality='All', fap_type='All'):
+        key = tuple(None if value in (None, 'All') else value for value in (state, functionality, fap_type))
+        return self._positions.get(key, EMPTY_POSITIONS)
+
+    # Function to get the rows of a selection as a DataFrame, in the original row order
+    def select(self, state='All', functionality='All', fap_type='All'):
+        return self.data.iloc[self.positions(state, functionality, fap_type)]
+
+
+# Materialized aggregate cube of the survey data, built once per data version: one cell per observed
+# STATE x EA NAME x FAP_TYPE x FAP_FUNCTIONALITY x FORMALITY combination with the FAP count and the count
+# and sum of KM_DIFF_COLUMN. Tables and choropleth values are rolled up from these cells, so their cost
+# depends on the number of distinct combinations, not on the number of survey rows. Rows missing a dimension
+# keep a cell of their own (NaN in that dimension), so they still count in the tables and means of the others.
+class AggregateCube:
+    def __init__(self, data):
+        self.cells = (data.groupby(list(CUBE_DIMENSIONS), observed=True, sort=False, dropna=False)[KM_DIFF_COLUMN]
+                      .agg(count='size', km_count='count', km_sum='sum')
+                      .reset_index())
+
+    # Function to get a copy of the cube with an ingested batch applied: the cells of the replaced rows are
+    # subtracted and the cells of the added rows added, leaving every other cell as it was
+    def upsert(self, replaced, added):
+        cube = AggregateCube.__new__(AggregateCube)
+        changes = [self.cells, AggregateCube(added).cells]
+        if len(replaced):
+            removed = AggregateCube(replaced).cells
+            removed[['count', 'km_count', 'km_sum']] = -removed[['count', 'km_count', 'km_sum']]
+            changes.append(removed)
+        cells = pd.concat([change.astype({dimension: object for dimension in CUBE_DIMENSIONS}) for change in changes], ignore_index=True)  # Missing values stay NaN
+        cells = cells.groupby(list(CUBE_DIMENSIONS), sort=False, dropna=False)[['count', 'km_count', 'km_sum']].sum().reset_index()
+        categorical = {dimension: "category" for dimension in CUBE_DIMENSIONS if isinstance(self.cells[dimension].dtype, pd.CategoricalDtype)}
+        cube.cells = cells[cells['count'] > 0].astype(categorical).reset_index(drop=True)
+        return cube
+
+    # Function to get the distinct values of a dimension, in order of first appearance in the survey data
+    def values(self, dimension):
+        return self.cells[dimension].unique().tolist()
+
+    # Function to roll the cube up to the given dimensions, keeping only the cells that match the filters
+    # (dimension name -> value, 'All' or None matching everything). Returns count, km_count, km_sum and km_mean.
+    def rollup(self, by, filters=None):
+        cells = self.cells
+        for dimension, value in (filters or {}).items():
+            if value not in (None, 'All'):
+                cells = cells[cells[dimension] == value]
+        rolled = cells.groupby(list(by), observed=True)[['count', 'km_count', 'km_sum']].sum()
+        rolled['km_mean'] = rolled['km_sum'] / rolled['km_count'].where(rolled['km_count'] > 0)
+        return rolled
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the FAP survey CSV into the columnar store read by the app.")
+    parser.add_argument("csv_path", nargs="?", default=CSV_PATH)
+    parser.add_argument("--output", default=None, help="Parquet file to write (default: next to the CSV)")
+    args = parser.parse_args()
+    print(f"Wrote {convert_csv_to_store(args.csv_path, args.output)}")
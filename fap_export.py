@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import plotly.io as pio
+import plotly.offline
+import streamlit.logger
+
+streamlit.logger.set_log_level("ERROR")  # The cached loaders run without a Streamlit runtime here
+
+from fap_assets import load_aggregate_cube, load_selection_index, load_state_gdf, load_state_geojson
+from fap_data import CSV_PATH, MAP_COLUMNS
+from fap_geo import GEO_BUNDLE_PATH, STATE_GEOJSON_PATH, polygon_path, state_key
+from fap_maps import generate_map_fap_functionalities, generate_map_fap_types
+
+# Batch export of every (state x functionality) and (state x FAP type) map of the app as static HTML (and PNG
+# when kaleido is installed) with its count table, rendered in parallel by a process pool. Each combination is
+# written as soon as it is rendered and recorded in a manifest with the hash of its inputs (its rows of the survey
+# data, the geo files and the map code), so later runs skip the combinations whose inputs have not changed.
+
+EXPORT_DIR = "exports"
+MANIFEST_NAME = "manifest.json"
+FORMATS = ("html", "png")
+
+# Source files the maps and count tables are drawn by (base layers and tables are built by fap_assets and
+# fap_data): changing them renders every combination again
+RENDERER_FILES = ("fap_maps.py", "fap_geo.py", "fap_assets.py", "fap_data.py", "fap_export.py")
+
+# Placeholder colour of the state boundaries, which st.plotly_chart replaces with the theme's colour. Exported files
+# are not drawn by Streamlit, so they get plotly's first default colour instead
+THEME_PLACEHOLDER_COLOR = "#000001"
+EXPORT_THEME_COLOR = "#636efa"
+
+# Map kinds: the column each map is filtered on and the columns of its count table
+EXPORT_KINDS = {
+    "functionalities": ("FAP_FUNCTIONALITY", ['STATE', 'FAP_FUNCTIONALITY']),
+    "types": ("FAP_TYPE", ['STATE', 'FAP_TYPE']),
+}
+
+# Function to get a file name part for a selection value, e.g. 'MFI/MFB' -> 'MFI_MFB'
+def slug(value):
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(value)).strip("_") or "_"
+
+# Function to get the sha1 of a file's content ('' when the file does not exist)
+def file_hash(file_path):
+    if not os.path.exists(file_path):
+        return ""
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+# Function to list every combination to export as (kind, state, value)
+def export_combinations(selection_index):
+    states = ['All'] + sorted(selection_index.data['STATE'].unique())
+    combinations = [("functionalities", state, value) for state in states for value in ['All', 'Active', 'Inactive']]
+    fap_types = ['All'] + list(selection_index.data['FAP_TYPE'].unique())
+    combinations += [("types", state, value) for state in states for value in fap_types]
+    return combinations
+
+# Function to hash the inputs of a combination: its rows of the survey data, the geo files its map is drawn
+# from, the map code and the output formats
+def combination_hash(selection_index, combination, shared_hash, formats):
+    kind, state, value = combination
+    if kind == "functionalities":
+        rows = selection_index.select(state, functionality=value)
+    else:
+        rows = selection_index.select(state, fap_type=value)
+    sha1 = hashlib.sha1(json.dumps([combination, shared_hash, sorted(formats)]).encode("utf-8"))
+    sha1.update(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+    if state != 'All':
+        sha1.update(file_hash(polygon_path(state)).encode("ascii"))
+    return sha1.hexdigest()
+
+# Function to get the output files of a combination, relative to the export directory
+def combination_files(combination, formats):
+    kind, state, value = combination
+    stem = os.path.join(kind, f"{slug(state_key(state))}__{slug(value)}")
+    return [f"{stem}.{file_format}" for file_format in formats] + [f"{stem}_counts.csv"]
+
+# Function to write a file atomically (a crash never leaves a half-written output behind)
+def write_atomic(file_path, content):
+    temporary_path = f"{file_path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content if isinstance(content, bytes) else content.encode("utf-8"))
+    os.replace(temporary_path, file_path)
+
+
+# Assets loaded once per worker process
+_worker_assets = {}
+
+def _init_worker(csv_path):
+    _worker_assets.update(
+        csv_path=csv_path,
+        selection_index=load_selection_index(csv_path, MAP_COLUMNS),
+        aggregate_cube=load_aggregate_cube(csv_path),
+        state_geojson_data=load_state_geojson(STATE_GEOJSON_PATH),
+        state_gdf=load_state_gdf(STATE_GEOJSON_PATH),
+    )
+
+# Function to replace the theme placeholder colour in the colour scales of a figure (a copy: its base layer traces
+# are shared by the cached base layers)
+def resolve_theme_colors(fig):
+    def resolve(trace):
+        colorscale = trace.get("colorscale")
+        if not isinstance(colorscale, (list, tuple)):
+            return trace
+        return dict(trace, colorscale=[[stop, EXPORT_THEME_COLOR if color == THEME_PLACEHOLDER_COLOR else color] for stop, color in colorscale])
+
+    return dict(fig, data=[resolve(trace) for trace in fig["data"]])
+
+# Function to render one combination and write its outputs; runs in a worker process
+def export_combination(combination, output_dir, formats):
+    kind, state, value = combination
+    assets = _worker_assets
+    if kind == "functionalities":
+        fig = generate_map_fap_functionalities(state, value, assets["selection_index"], assets["state_gdf"], assets["state_geojson_data"])
+    else:
+        fig = generate_map_fap_types(state, value, assets["selection_index"], assets["state_gdf"], assets["state_geojson_data"])
+    fig = resolve_theme_colors(fig)
+
+    # Count table of the combination, as shown next to the map in the app
+    column, table_columns = EXPORT_KINDS[kind]
+    counts = assets["aggregate_cube"].rollup(table_columns, {'STATE': state, column: value})['count'].unstack(fill_value=0)
+
+    files = combination_files(combination, formats)
+    for file_name in files:
+        file_path = os.path.join(output_dir, file_name)
+        if file_name.endswith(".html"):
+            write_atomic(file_path, pio.to_html(fig, include_plotlyjs="directory", full_html=True, validate=False))
+        elif file_name.endswith(".png"):
+            write_atomic(file_path, pio.to_image(fig, format="png", validate=False))
+        else:
+            write_atomic(file_path, counts.to_csv())
+    return files
+
+def _export_task(task):
+    combination, output_dir, formats = task
+    return combination, export_combination(combination, output_dir, formats)
+
+# Function to read the manifest of an export directory (combination key -> input hash and files)
+def read_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# Function to export every combination whose inputs changed since the last run (all of them with force),
+# rendering in parallel and updating the manifest as each combination is written. Returns (written, skipped).
+def export_all(output_dir=EXPORT_DIR, csv_path=CSV_PATH, formats=("html",), workers=None, force=False, progress=None):
+    formats = tuple(formats)
+    if "png" in formats and importlib.util.find_spec("kaleido") is None:
+        print("kaleido is not installed, skipping PNG output", file=sys.stderr)
+        formats = tuple(file_format for file_format in formats if file_format != "png")
+    for kind in EXPORT_KINDS:
+        os.makedirs(os.path.join(output_dir, kind), exist_ok=True)
+        if "html" in formats:
+            write_atomic(os.path.join(output_dir, kind, "plotly.min.js"), plotly.offline.get_plotlyjs())  # Shared by the HTML maps
+
+    # Hash the inputs of every combination and keep the ones not exported with the same inputs yet
+    selection_index = load_selection_index(csv_path, MAP_COLUMNS)
+    shared_hash = hashlib.sha1("|".join(file_hash(path) for path in (STATE_GEOJSON_PATH, GEO_BUNDLE_PATH) + RENDERER_FILES).encode("ascii")).hexdigest()
+    manifest = read_manifest(output_dir)
+    combinations = export_combinations(selection_index)
+    pending = {}
+    for combination in combinations:
+        key = "/".join(combination)
+        input_hash = combination_hash(selection_index, combination, shared_hash, formats)
+        entry = manifest.get(key)
+        unchanged = entry and entry["hash"] == input_hash and all(os.path.exists(os.path.join(output_dir, file_name)) for file_name in entry["files"])
+        if force or not unchanged:
+            pending[key] = (combination, input_hash)
+    skipped = len(combinations) - len(pending)
+
+    # Render in parallel, recording every combination in the manifest as soon as its files are written
+    written = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(csv_path,)) as executor:
+            futures = [executor.submit(_export_task, (combination, output_dir, formats)) for combination, _ in pending.values()]
+            for future in as_completed(futures):
+                combination, files = future.result()
+                key = "/".join(combination)
+                manifest[key] = dict(hash=pending[key][1], files=files)
+                write_atomic(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=1, sort_keys=True))
+                written += 1
+                if progress:
+                    progress(written, len(pending), key)
+    return written, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every state map of the app (by functionality and by FAP type) with its count table.")
+    parser.add_argument("--output", default=EXPORT_DIR, help="Export directory")
+    parser.add_argument("--csv", default=CSV_PATH, help="Survey data to export")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["html"])
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="Export every combination, even unchanged ones")
+    args = parser.parse_args()
+
+    written, skipped = export_all(args.output, args.csv, args.formats, args.workers, args.force,
+                                  progress=lambda done, total, key: print(f"[{done}/{total}] {key}"))
+    print(f"Exported {written} combinations, {skipped} unchanged")
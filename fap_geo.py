@@ -0,0 +1,238 @@
+import argparse
+import glob
+import json
+import mmap
+import os
+import re
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# GeoJSON data for state boundaries and the per-state EA polygon files
+STATE_GEOJSON_PATH = "ngaadmbndaadm1osgof20161215.geojson"
+POLYGONS_DIR = "polygons"
+
+# Packed geo assets written by the build command below
+GEO_BUNDLE_PATH = "geo_assets.bin"
+
+# Equal-area projection used to compute state centroids (geographic centroids are distorted)
+CENTROID_CRS = "ESRI:102022"  # Africa Albers Equal Area Conic
+
+# Kilometres per degree of latitude
+KM_PER_DEGREE = 111.32
+
+# Levels of detail sent to the browser as (minimum map zoom, simplification tolerance, coordinate grid) in degrees.
+# The tolerance stays below a pixel two zoom steps past the level's zoom, so zooming in a little stays sharp.
+GEOMETRY_LEVELS = (
+    (0, 0.005, 0.001),  # National view (zoom 5.85)
+    (7, 0.001, 0.0001),  # State view (zoom 7)
+    (9, 0.0002, 0.00001),
+)
+
+# Function to get the key a state is filed under (upper case, single spaces), e.g. 'Akwa Ibom' -> 'AKWA IBOM'
+def state_key(state_name):
+    return re.sub(r"[^A-Z0-9]+", " ", state_name.upper()).strip()
+
+# Function to get the EA polygon file of a state
+def polygon_path(state_name, polygons_dir=POLYGONS_DIR):
+    return os.path.join(polygons_dir, f"{state_key(state_name)}.geojson")
+
+# Function to read a GeoJSON file
+def read_geojson(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# Function to build the state boundaries GeoDataFrame, with the centroid of every state in the
+# centroid_lat / centroid_lon columns
+def state_gdf_from_geojson(state_geojson_data):
+    state_gdf = gpd.GeoDataFrame.from_features(state_geojson_data["features"], crs="EPSG:4326")
+    centroids = state_gdf.geometry.to_crs(CENTROID_CRS).centroid.to_crs(state_gdf.crs)
+    state_gdf["centroid_lat"] = centroids.y
+    state_gdf["centroid_lon"] = centroids.x
+    return state_gdf
+
+# Function to pick the level of detail for a map zoom
+def geometry_level(zoom_level):
+    return max(level for level, (min_zoom, _, _) in enumerate(GEOMETRY_LEVELS) if zoom_level >= min_zoom)
+
+# Function to simplify geometries for a level of detail: topology-preserving simplification, Z stripped
+# and coordinates quantized to the level's grid (rounded so they also serialize as short decimals)
+def simplify_geometries(geometries, level):
+    _, tolerance, grid_size = GEOMETRY_LEVELS[level]
+    geometries = shapely.simplify(shapely.force_2d(geometries), tolerance, preserve_topology=True)
+    geometries = shapely.set_precision(geometries, grid_size)
+    decimals = round(-np.log10(grid_size))
+    return shapely.transform(geometries, lambda coords: np.round(coords, decimals))
+
+# Function to get the polygons of every EA feature (MultiPolygons and GeometryCollections exploded, points
+# dropped) together with the index of the feature each polygon belongs to
+def ea_polygons(polygon_geojson_data):
+    geometries = shapely.force_2d(gpd.GeoDataFrame.from_features(polygon_geojson_data["features"]).geometry.values)
+    parts, feature_index = shapely.get_parts(geometries, return_index=True)
+    parts, part_index = shapely.get_parts(parts, return_index=True)  # Members of GeometryCollections
+    feature_index = feature_index[part_index]
+    is_polygon = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    return parts[is_polygon], feature_index[is_polygon]
+
+# Function to join every ring (exterior and interior) of the polygons into one NaN-separated (lon, lat) line,
+# so that all outlines can be drawn with a single trace
+def outline_coordinates(polygons, level=None):
+    if level is not None:
+        polygons = simplify_geometries(polygons, level)
+    coords, ring_index = shapely.get_coordinates(shapely.get_rings(polygons), return_index=True)
+    breaks = np.flatnonzero(np.diff(ring_index)) + 1
+    return np.insert(coords, breaks, np.nan, axis=0)
+
+# Function to get the EA outlines of a state polygon file as (lats, lons), optionally simplified for a level of detail
+def ea_outline_coordinates(polygon_geojson_data, level=None):
+    coords = outline_coordinates(ea_polygons(polygon_geojson_data)[0], level)
+    return coords[:, 1], coords[:, 0]
+
+# Function to bin points into a hexagonal grid with cells size_km across and count the points of every
+# category per cell. Each point goes to the nearer centre of two offset rectangular lattices, which tiles the
+# plane into hexagons; longitudes are scaled by the cosine of the mean latitude so cells are regular on the ground.
+# Returns a DataFrame with the category, cell centre (lat, lon) and count of every non-empty (category, cell).
+def hex_bin_counts(lat, lon, categories, size_km):
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    lon_scale = np.cos(np.radians(np.nanmean(lat))) if len(lat) else 1.0
+    step_x = size_km / KM_PER_DEGREE
+    step_y = step_x * np.sqrt(3)
+    x, y = lon * lon_scale / step_x, lat / step_y
+    xa, ya = np.round(x), np.round(y)
+    xb, yb = np.floor(x) + 0.5, np.floor(y) + 0.5
+    use_a = (x - xa) ** 2 + 3 * (y - ya) ** 2 <= (x - xb) ** 2 + 3 * (y - yb) ** 2
+    cells = pd.DataFrame({
+        'category': categories,
+        'lat': np.round(np.where(use_a, ya, yb) * step_y, 5),
+        'lon': np.round(np.where(use_a, xa, xb) * step_x / lon_scale, 5),
+    })
+    return cells.groupby(['category', 'lat', 'lon'], observed=True, sort=False).size().reset_index(name='count')
+
+
+# Layout of the bundle: magic, little-endian uint64 length of the JSON index, the index, then the array data
+# (8-byte aligned). The index maps every state key to its name, bbox, centroid, EA names and the
+# (offset, dtype, shape) of its arrays, so any state's geometry is one dict lookup and one buffer view.
+BUNDLE_MAGIC = b"A2FGEO1\0"
+BUNDLE_ALIGN = 8
+
+# Function to pack the state boundaries, every state's EA polygons and outlines, centroids and bounding boxes
+# into one binary file
+def build_bundle(output_path=GEO_BUNDLE_PATH, state_geojson_path=STATE_GEOJSON_PATH, polygons_dir=POLYGONS_DIR):
+    state_gdf = state_gdf_from_geojson(read_geojson(state_geojson_path))
+    polygon_files = {state_key(os.path.splitext(os.path.basename(path))[0]): path
+                     for path in glob.glob(os.path.join(polygons_dir, "*.geojson"))}
+    blobs, offset, states = [], 0, {}
+
+    def add_array(arrays, name, values):
+        nonlocal offset
+        values = np.ascontiguousarray(values)
+        arrays[name] = [offset, values.dtype.str, list(values.shape)]
+        padding = -values.nbytes % BUNDLE_ALIGN
+        blobs.append(values.tobytes() + b"\0" * padding)
+        offset += values.nbytes + padding
+
+    for row in state_gdf.itertuples():
+        key, arrays = state_key(row.admin1Name), {}
+        boundary = shapely.force_2d(row.geometry)
+        _, coords, (ring_offsets, polygon_offsets, _) = shapely.to_ragged_array([shapely.multipolygons(shapely.get_parts(boundary))])
+        add_array(arrays, "boundary_coords", coords)
+        add_array(arrays, "boundary_ring_offsets", ring_offsets)
+        add_array(arrays, "boundary_polygon_offsets", polygon_offsets)
+        ea_names = []
+        if key in polygon_files:
+            polygon_geojson_data = read_geojson(polygon_files[key])
+            polygons, feature_index = ea_polygons(polygon_geojson_data)
+            features = np.unique(feature_index)
+            ea_names = [polygon_geojson_data["features"][i]["properties"].get("EA_NAME") for i in features]
+            multipolygons = shapely.multipolygons(polygons, indices=np.searchsorted(features, feature_index))
+            _, coords, (ring_offsets, polygon_offsets, geometry_offsets) = shapely.to_ragged_array(multipolygons)
+            add_array(arrays, "ea_coords", coords)
+            add_array(arrays, "ea_ring_offsets", ring_offsets)
+            add_array(arrays, "ea_polygon_offsets", polygon_offsets)
+            add_array(arrays, "ea_geometry_offsets", geometry_offsets)
+            for level in range(len(GEOMETRY_LEVELS)):
+                add_array(arrays, f"ea_outline_{level}", outline_coordinates(polygons, level))
+        states[key] = {
+            "name": row.admin1Name,
+            "bbox": list(boundary.bounds),
+            "centroid": [row.centroid_lon, row.centroid_lat],
+            "ea_names": ea_names,
+            "arrays": arrays,
+        }
+
+    index = json.dumps({"levels": GEOMETRY_LEVELS, "states": states}).encode("utf-8")
+    header = BUNDLE_MAGIC + np.uint64(len(index)).tobytes() + index
+    header += b"\0" * (-len(header) % BUNDLE_ALIGN)
+    with open(output_path, "wb") as f:
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    return output_path
+
+
+# Function to check whether the bundle is at least as recent as the GeoJSON files it is built from (the state
+# boundaries, every EA polygon file and the polygon directory, whose time changes when a file is added or removed)
+def bundle_is_fresh(bundle_path=GEO_BUNDLE_PATH, state_geojson_path=STATE_GEOJSON_PATH, polygons_dir=POLYGONS_DIR):
+    if not os.path.exists(bundle_path):
+        return False
+    sources = [state_geojson_path, polygons_dir] + glob.glob(os.path.join(polygons_dir, "*.geojson"))
+    bundle_time = os.path.getmtime(bundle_path)
+    return all(bundle_time >= os.path.getmtime(path) for path in sources if os.path.exists(path))
+
+# Read-only view of a bundle written by build_bundle. The file is memory-mapped once, and arrays are
+# returned as zero-copy NumPy views into the mapping.
+class GeoBundle:
+    def __init__(self, file_path=GEO_BUNDLE_PATH):
+        with open(file_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f"{file_path} is not a geo asset bundle")
+        index_start = len(BUNDLE_MAGIC) + 8
+        index_length = int(np.frombuffer(self._mmap, dtype="<u8", count=1, offset=len(BUNDLE_MAGIC))[0])
+        index = json.loads(self._mmap[index_start:index_start + index_length])
+        self._data_start = index_start + index_length + (-(index_start + index_length) % BUNDLE_ALIGN)
+        self.states = index["states"]
+        if [tuple(level) for level in index["levels"]] != list(GEOMETRY_LEVELS):
+            raise ValueError(f"{file_path} was built with other levels of detail, rebuild it")
+
+    # Function to check whether the bundle has EA polygons for a state
+    def has_eas(self, state_name):
+        state = self.states.get(state_key(state_name))
+        return state is not None and "ea_coords" in state["arrays"]
+
+    # Function to get the metadata (name, bbox, centroid, EA names) of a state
+    def state_info(self, state_name):
+        return self.states[state_key(state_name)]
+
+    # Function to get one of a state's arrays as a read-only view into the bundle
+    def array(self, state_name, name):
+        offset, dtype, shape = self.states[state_key(state_name)]["arrays"][name]
+        return np.frombuffer(self._mmap, dtype=dtype, count=int(np.prod(shape)), offset=self._data_start + offset).reshape(shape)
+
+    # Function to get a state's EA outlines at a level of detail as (lats, lons) views
+    def ea_outlines(self, state_name, level):
+        if not self.has_eas(state_name):
+            return np.empty(0), np.empty(0)
+        coords = self.array(state_name, f"ea_outline_{level}")
+        return coords[:, 1], coords[:, 0]
+
+    # Function to rebuild a state's EA polygons as a GeoJSON FeatureCollection (one MultiPolygon per EA)
+    def ea_geojson(self, state_name):
+        features = []
+        if self.has_eas(state_name):
+            offsets = tuple(self.array(state_name, name) for name in ("ea_ring_offsets", "ea_polygon_offsets", "ea_geometry_offsets"))
+            geometries = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, self.array(state_name, "ea_coords"), offsets)
+            for ea_name, geometry in zip(self.state_info(state_name)["ea_names"], geometries):
+                features.append({"type": "Feature", "properties": {"EA_NAME": ea_name}, "geometry": shapely.geometry.mapping(geometry)})
+        return {"type": "FeatureCollection", "features": features}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the state boundaries and EA polygons into the geo asset bundle read by the app.")
+    parser.add_argument("--output", default=GEO_BUNDLE_PATH)
+    parser.add_argument("--state-geojson", default=STATE_GEOJSON_PATH)
+    parser.add_argument("--polygons-dir", default=POLYGONS_DIR)
+    args = parser.parse_args()
+    print(f"Wrote {build_bundle(args.output, args.state_geojson, args.polygons_dir)}")
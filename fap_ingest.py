@@ -0,0 +1,67 @@
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from fap_data import CSV_PATH, INSTANCE_COLUMN, batches_dir, read_fap_csv, read_fap_data, read_ingest_log
+
+# Append-only ingest of new survey batches. Every batch is stored next to the shipped data (A2F_FAP_v1.batches/)
+# as the rows it adds, with their distances already computed, and the current rows of the instances it replaces.
+# The log written last lists the batches in order with the states they touched: readers apply them on top of the
+# shipped data, the aggregate cube is updated from the two small files only, and the app re-renders the touched
+# states only. A batch replaces every row of its instances, so identical rows within an instance (several FAPs of
+# the same kind) are all kept, and a batch that is already in the log is skipped.
+
+# Function to ingest a batch of survey rows (CSV with the survey columns) on top of the survey data of csv_path.
+# Returns the log entry of the batch, or None when the batch has no rows or was ingested before.
+def ingest_batch(batch_path, csv_path=CSV_PATH):
+    batch = read_fap_csv(batch_path)  # Compact dtypes, distances computed for the batch rows only
+    batch = batch.dropna(subset=[INSTANCE_COLUMN]).reset_index(drop=True)
+    if batch.empty:
+        return None
+
+    # Current rows of the instances the batch replaces (from the shipped data or an earlier batch)
+    current = read_fap_data(csv_path)
+    batch[INSTANCE_COLUMN] = batch[INSTANCE_COLUMN].astype(current[INSTANCE_COLUMN].dtype)  # Same keys as the survey data
+    replaced = current[current[INSTANCE_COLUMN].isin(batch[INSTANCE_COLUMN].unique())]
+
+    log = read_ingest_log(csv_path)
+    number = len(log) + 1
+    digest = hashlib.sha1(pd.util.hash_pandas_object(batch, index=False).to_numpy().tobytes()).hexdigest()[:12]
+    if any(logged["id"].endswith(f"-{digest}") for logged in log):
+        return None
+    directory = batches_dir(csv_path)
+    os.makedirs(directory, exist_ok=True)
+    entry = dict(
+        id=f"{number:05d}-{digest}",
+        source=os.path.basename(batch_path),
+        added=f"batch-{number:05d}.parquet",
+        replaced=f"batch-{number:05d}.replaced.parquet",
+        rows=len(batch),
+        replaced_rows=len(replaced),
+        states=sorted(set(batch['STATE'].astype(str)) | set(replaced['STATE'].astype(str))),
+    )
+    batch.to_parquet(os.path.join(directory, entry["added"]), engine="pyarrow", index=False)
+    replaced.to_parquet(os.path.join(directory, entry["replaced"]), engine="pyarrow", index=False)
+
+    # Publish the batch by rewriting the log last, atomically, so readers never see a half-written batch
+    log_path = os.path.join(directory, "log.json")
+    with open(f"{log_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(log + [entry], f, indent=1)
+    os.replace(f"{log_path}.tmp", log_path)
+    return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest new survey batches (CSV, keyed by InstanceID) on top of the survey data read by the app.")
+    parser.add_argument("batches", nargs="+", help="Batch CSV files, ingested in order")
+    parser.add_argument("--csv", default=CSV_PATH, help="Survey data the batches are ingested into")
+    args = parser.parse_args()
+    for batch_path in args.batches:
+        entry = ingest_batch(batch_path, args.csv)
+        if entry is None:
+            print(f"{batch_path}: nothing to ingest (no rows, or ingested before)")
+        else:
+            print(f"{batch_path}: {entry['rows']} rows added, {entry['replaced_rows']} replaced, states {', '.join(entry['states'])}")
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+# Load test of the app: N simulated analysts connect to local Streamlit servers over the same websocket protocol
+# as the browser and click through random pages, states and filters, one script rerun per choice. Reports
+# latency percentiles (send to script finished), throughput, payload bytes and the RSS of every server process,
+# so worker counts can be sized and the sharing of caches between the sessions of a process checked.
+# (Streamlit's AppTest installs one process-wide runtime per run, so it cannot drive concurrent sessions.)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "FAP_STATUS.py")
+PAGES = ("FAP Status Visualization", "FAP Type Visualization", "FAP Proximity Visualization", "FAP Location Quality")
+
+# Sidebar widgets a session changes on every page, after picking the page
+PAGE_WIDGETS = {
+    PAGES[0]: ("Select State", "Filter FAP Functionality on the map", "Select FAP Functionality"),
+    PAGES[1]: ("Select State", "Filter FAP Type on the map", "Select FAP Type"),
+    PAGES[2]: ("Select FAP Type", "Select State", "Select Proximity Metric"),
+    PAGES[3]: ("Select State", "Select Location Check"),
+}
+BROWSER_FILTER_PROBABILITY = 0.3
+
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+RSS_SAMPLE_SECONDS = 0.2
+SERVER_START_TIMEOUT = 60
+
+# Function to get the resident set size of a process in bytes (None where /proc is not available)
+def process_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+# Function to check whether a Streamlit server answers its health check on a local port
+def server_is_up(port):
+    try:
+        with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health", timeout=1):
+            return True
+    except OSError:
+        return False
+
+# Function to start a local Streamlit server for the app and wait until it answers its health check
+def start_server(port, env=None):
+    if server_is_up(port):
+        raise RuntimeError(f"Port {port} is already serving, pass --url to load test that server or pick another --port")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true", "--server.port", str(port),
+         "--browser.gatherUsageStats", "false"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        if server_is_up(port):
+            return process
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Streamlit server on port {port} did not start")
+
+
+# One simulated browser session: sends reruns with the widget states it has set and reads the app's
+# messages until the script finishes, keeping track of the sidebar widgets the app rendered
+class SimulatedSession:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.widgets = {}  # Label -> (widget kind, widget id, options) of the last rerun
+        self.widget_states = {}  # Widget id -> WidgetState sent with every rerun
+
+    # Function to set a widget of the last rerun by label (options by value, checkboxes by bool)
+    def set_widget(self, label, value):
+        kind, widget_id, _ = self.widgets[label]
+        if kind == "checkbox":
+            self.widget_states[widget_id] = WidgetState(id=widget_id, bool_value=value)
+        else:
+            self.widget_states[widget_id] = WidgetState(id=widget_id, string_value=value)
+
+    # Function to run the script once; returns (seconds, bytes received, error message or None)
+    async def rerun(self):
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = ""
+        back_msg.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+        started = time.perf_counter()
+        await self.websocket.send(back_msg.SerializeToString())
+
+        self.widgets, received, error = {}, 0, None
+        while True:
+            data = await self.websocket.recv()
+            received += len(data)
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            msg_type = msg.WhichOneof("type")
+            if msg_type == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in ("radio", "selectbox", "checkbox"):
+                    widget = getattr(element, element_type)
+                    self.widgets[widget.label] = (element_type, widget.id, list(getattr(widget, "options", [])))
+                elif element_type == "exception":
+                    error = element.exception.message
+            elif msg_type == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_SUCCESSFULLY and error is None:
+                    error = ForwardMsg.ScriptFinishedStatus.Name(msg.script_finished)
+                return time.perf_counter() - started, received, error
+
+
+# Function to import the websocket client the sessions connect with (a test-only dependency, not needed by the app)
+def import_websockets():
+    try:
+        import websockets
+    except ImportError:
+        raise ImportError("The load test needs the websockets package: pip install websockets") from None
+    return websockets
+
+# Function to drive one simulated session against a server: pick a random page, then random values for the
+# page's widgets, one rerun per choice. Returns the (page, seconds, bytes, error) of every rerun.
+async def simulate_session(url, actions, seed, think_time=0.0):
+    rng = random.Random(seed)
+    samples = []
+    websockets = import_websockets()
+    async with websockets.connect(f"{url}/_stcore/stream", subprotocols=["streamlit"], max_size=None) as websocket:
+        session = SimulatedSession(websocket)
+        samples.append((PAGES[0],) + await session.rerun())
+        while len(samples) < actions:
+            page = rng.choice(PAGES)
+            session.set_widget("Select Page", page)
+            samples.append((page,) + await session.rerun())
+            for label in PAGE_WIDGETS[page]:
+                if len(samples) >= actions:
+                    break
+                if label not in session.widgets:
+                    continue  # Hidden by another choice (e.g. filtering in the browser)
+                kind, _, options = session.widgets[label]
+                session.set_widget(label, rng.random() < BROWSER_FILTER_PROBABILITY if kind == "checkbox" else rng.choice(options))
+                samples.append((page,) + await session.rerun())
+                await asyncio.sleep(think_time)
+    return samples
+
+# Function to sample the RSS of the server processes until stopped
+async def sample_rss(pids, rss_samples, stop):
+    while not stop.is_set():
+        for pid in pids:
+            rss = process_rss(pid)
+            if rss is not None:
+                rss_samples[pid].append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+# Function to run concurrent sessions spread round-robin over the servers, sampling the RSS of the given
+# server processes (url -> pid, None when the server was not started here)
+async def run_sessions(server_pids, sessions, actions, seed=0, think_time=0.0):
+    urls = list(server_pids)
+    pids = [pid for pid in server_pids.values() if pid is not None]
+    rss_samples = {pid: [] for pid in pids}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(pids, rss_samples, stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(simulate_session(urls[session % len(urls)], actions, seed * 1000 + session, think_time) for session in range(sessions)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+    return dict(results=results, elapsed=elapsed, server_pids=server_pids, rss_samples=rss_samples)
+
+# Function to run the load test on new local servers (or on running ones with urls) and summarize it
+def run_load_test(sessions, actions, servers=1, port=8601, urls=None, seed=0, think_time=0.0):
+    import_websockets()  # Fail before starting servers, not as failed sessions
+    processes = []
+    try:
+        if urls:
+            server_pids = {url.rstrip("/").replace("http", "ws", 1): None for url in urls}
+        else:
+            processes = [start_server(port + server) for server in range(servers)]
+            server_pids = {f"ws://localhost:{port + server}": process.pid for server, process in enumerate(processes)}
+        return summarize(asyncio.run(run_sessions(server_pids, sessions, actions, seed, think_time)))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+# Function to summarize a load test run: latency percentiles (overall and per page), throughput, payload bytes,
+# failed sessions and reruns, and the RSS of every server process
+def summarize(run):
+    failed_sessions = [str(result) for result in run["results"] if isinstance(result, BaseException)]
+    samples = [sample for result in run["results"] if not isinstance(result, BaseException) for sample in result]
+
+    def latency(page_samples):
+        seconds = np.asarray([sample[1] for sample in page_samples]) * 1000
+        received = np.asarray([sample[2] for sample in page_samples])
+        return dict({f"p{percentile}_ms": round(float(np.percentile(seconds, percentile)), 1) for percentile in LATENCY_PERCENTILES},
+                    mean_ms=round(float(seconds.mean()), 1), max_ms=round(float(seconds.max()), 1), reruns=len(seconds),
+                    mean_kb=round(float(received.mean()) / 1024, 1))
+
+    rss_mb = []
+    for url, pid in run["server_pids"].items():
+        rss = run["rss_samples"].get(pid)
+        if rss:
+            rss_mb.append(dict(url=url, pid=pid, start=round(rss[0] / 2 ** 20, 1), peak=round(max(rss) / 2 ** 20, 1), end=round(rss[-1] / 2 ** 20, 1)))
+        else:
+            rss_mb.append(dict(url=url, pid=pid, start=None, peak=None, end=None))
+
+    return dict(
+        sessions=len(run["results"]),
+        failed_sessions=failed_sessions,
+        servers=len(run["server_pids"]),
+        reruns=len(samples),
+        errors=sum(sample[3] is not None for sample in samples),
+        elapsed_s=round(run["elapsed"], 2),
+        throughput_reruns_per_s=round(len(samples) / run["elapsed"], 2),
+        latency=latency(samples) if samples else None,
+        latency_by_page={page: latency([sample for sample in samples if sample[0] == page])
+                         for page in PAGES if any(sample[0] == page for sample in samples)},
+        rss_mb=rss_mb,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated sessions through the app and report latency, throughput and server RSS.")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument("--actions", type=int, default=20, help="Reruns per session")
+    parser.add_argument("--servers", type=int, default=1, help="Local server processes to start, sessions are spread over them")
+    parser.add_argument("--port", type=int, default=8601, help="Port of the first local server")
+    parser.add_argument("--url", nargs="+", default=None, help="Run against these running servers instead (no RSS)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a session waits between filter changes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the summary to this JSON file")
+    args = parser.parse_args()
+
+    summary = run_load_test(args.sessions, args.actions, args.servers, args.port, args.url, args.seed, args.think_time)
+    print(json.dumps(summary, indent=1))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
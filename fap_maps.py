@@ -0,0 +1,450 @@
+import json
+
+import numpy as np
+import plotly.colors
+import streamlit as st
+
+from fap_assets import geo_version, load_ea_outlines_selected_state, load_state_gdf, load_state_geometry
+from fap_geo import STATE_GEOJSON_PATH, hex_bin_counts
+from fap_profiling import stage
+from fap_quality import LOCATION_CHECKS
+from fap_tiles import EA_MIN_ZOOM, fap_layer, tile_url
+
+# Maps are composed from layers: static base layers per state (boundaries below the data, EA outlines above it),
+# built once per process and geo asset version, plus the data layers of the request. Figures are plain dicts
+# ({"data": [...], "layout": {...}}) so composing a map never copies or revalidates the cached base layers.
+# With a tile server configured (A2F_TILE_URL, see fap_tiles), EA outlines and FAP markers are mapbox layers of
+# vector tiles instead of traces: the figure holds their style only and the browser fetches the tiles in view.
+
+# Map view of the whole country, and zoom of a single state
+NIGERIA_CENTER = {"lat": 9.0820, "lon": 8.6753}
+NATIONAL_ZOOM = 5.85
+STATE_ZOOM = 7
+MAP_STYLE = "carto-positron"
+MAP_HEIGHT = 850
+
+# The national maps switch from one marker per FAP to FAP counts per hexagonal bin above this many points.
+# State maps always draw one marker per FAP.
+AGGREGATE_POINT_THRESHOLD = 20000
+HEX_BIN_SIZE_KM = 15
+HEX_BIN_MARKER_SIZE = 40  # Marker diameter in pixels of the fullest bin
+
+# Coordinates of FAP markers are rounded to the survey precision
+SURVEY_DECIMALS = 5
+
+# Coverage maps carry the distance of at most this many grid cells as hover points (and colour bar) over the image
+COVERAGE_HOVER_POINTS = 3000
+
+# Radius in pixels of the FAP circles drawn from tiles
+TILE_CIRCLE_RADIUS = 6
+
+# FAP columns shown when hovering a marker
+HOVER_COLUMNS = ('FAP_TYPE', 'FORMALITY', 'FAP_FUNCTIONALITY')
+
+# Defined colors for FAP functionalities
+FAP_FUNCTIONALITY_COLORS = {'Active': 'green', 'Inactive': 'red'}
+
+# Define colors for FAP types
+FAP_TYPE_COLORS = {
+    'Financial Service agent (POS agents)': 'green',
+    'Cooperative/ Social group/Women group/savings group/farmer groups etc.': 'blue',
+    'MFI/MFB': 'red',
+    'ATM (This does not include ATMs at a bank branch)': 'orange',
+    'Bank branch': 'purple',
+    'Payment services banks (MTN Y’ello, Money master, 9PSB, Hope)': 'yellow',
+    'Moneylender': 'cyan',
+    'Bureau De Change (BDC)': 'magenta',
+    'Capital market operators (portfolio/fund managers)': 'lime',
+    'Insurance company/agent/broker': 'brown',
+    'Pension provider': 'teal',
+    'Non-Interest Banks': 'pink',
+    'Others (specify)': 'gray'
+}
+
+# Define colors for the location checks of FAPs (see fap_quality)
+LOCATION_CHECK_COLORS = dict(zip(LOCATION_CHECKS, ['black', 'red', 'orange', 'magenta', 'gray', 'green']))
+
+# Function to get the map center and zoom for the selected state ('All', or a state without boundary, shows Nigeria)
+def map_view(selected_state, state_gdf):
+    selected_state_gdf = state_gdf[state_gdf['admin1Name'] == selected_state]
+    if selected_state == 'All' or selected_state_gdf.empty:
+        return dict(NIGERIA_CENTER), NATIONAL_ZOOM
+    center = {"lat": float(selected_state_gdf["centroid_lat"].values[0]), "lon": float(selected_state_gdf["centroid_lon"].values[0])}
+    return center, STATE_ZOOM
+
+@st.cache_resource(show_spinner=False, max_entries=128)
+def _load_base_layers(selected_state, version, url):
+    state_gdf = load_state_gdf(STATE_GEOJSON_PATH)
+    center, zoom_level = map_view(selected_state, state_gdf)
+    shown = state_gdf.index if selected_state == 'All' else state_gdf.index[state_gdf['admin1Name'] == selected_state]
+
+    # Simplified boundaries of the shown states, one feature per state with its index as id
+    geojson = json.loads(load_state_geometry(STATE_GEOJSON_PATH, zoom_level)[shown].to_json())
+
+    # Choropleth map for state boundaries, drawn below the data
+    boundaries = dict(
+        type="choroplethmapbox",
+        subplot="mapbox",
+        geojson=geojson,
+        locations=shown.tolist(),
+        z=[1] * len(shown),
+        colorscale=[[0.0, "#000001"], [1.0, "#000001"]],
+        showscale=False,
+        marker=dict(opacity=0.5),
+        hovertemplate="index=%{location}<extra></extra>",
+        name="",
+        showlegend=True,
+    )
+
+    # EA outlines of every state from the tiles, shown from the zoom of a state map on (the national view too)
+    layers = []
+    if url:
+        layers.append(dict(sourcetype="vector", source=[url], sourcelayer="eas", type="line", color="purple",
+                           line=dict(width=2), minzoom=EA_MIN_ZOOM))
+
+    # Polygons (EAs) of the selected state, as one trace with NaN-separated rings drawn above the data
+    above = []
+    if selected_state != 'All' and not url:
+        ea_lats, ea_lons = load_ea_outlines_selected_state(selected_state, zoom_level)
+        if len(ea_lats):
+            above.append(dict(
+                type="scattermapbox",
+                mode="lines",
+                lat=ea_lats,
+                lon=ea_lons,
+                line=dict(color="purple", width=4),
+                showlegend=False  # Exclude from legend
+            ))
+
+    return dict(center=center, zoom=zoom_level, geojson=geojson, below=[boundaries], above=above, layers=layers, tile_url=url)
+
+# Function to get the static base layers of a state's map ('All' for Nigeria): view, boundary GeoJSON, the traces
+# drawn below ("below") and above ("above") the data, the mapbox layers ("layers") and the tile URL (None without
+# tile server). Shared read-only by every figure.
+def load_base_layers(selected_state):
+    with stage("base_layers"):
+        return _load_base_layers(selected_state, geo_version(selected_state), tile_url())
+
+# Function to compose a map figure (plain dict) from the base layers of a state and the data traces of a request
+def compose_map(base, traces, title, legend_title=None, layout=None, boundaries=True, layers=()):
+    figure_layout = dict(
+        mapbox=dict(
+            domain=dict(x=[0.0, 1.0], y=[0.0, 1.0]),
+            style=MAP_STYLE,
+            center=base["center"],
+            zoom=base["zoom"],
+            layers=list(layers) + base["layers"],
+        ),
+        height=MAP_HEIGHT,
+        margin=dict(r=0, l=0, t=50, b=0),
+        title=dict(text=title),
+        legend=dict(tracegroupgap=0),
+    )
+    if legend_title:
+        figure_layout["legend"]["title"] = dict(text=legend_title)
+    figure_layout.update(layout or {})
+    data = (base["below"] if boundaries else []) + list(traces) + base["above"]
+    return dict(data=data, layout=figure_layout)
+
+# Function to round coordinates to the precision of the survey (5 decimals, about a metre), as float64 so they
+# serialize as short decimals
+def survey_coordinates(values):
+    return np.round(np.asarray(values, dtype=np.float64), SURVEY_DECIMALS)
+
+# Function to build a marker trace of FAP points
+def fap_marker_trace(fap_filtered_data, color, name, **trace):
+    return dict(
+        type="scattermapbox",
+        mode="markers",
+        lat=survey_coordinates(fap_filtered_data["LATITUDE"]),
+        lon=survey_coordinates(fap_filtered_data["LONGITUDE"]),
+        marker=dict(
+            size=13,
+            color=color,
+            opacity=0.7,
+        ),
+        name=f"{name}",  # Legend label for each marker
+        **trace
+    )
+
+# Function to build the marker traces of the FAPs of one category: one trace per (FAP_TYPE, FORMALITY,
+# FAP_FUNCTIONALITY) of the category, so the hover text is one template per trace instead of a string per FAP.
+# The traces share one legend entry.
+def fap_marker_traces(fap_filtered_data, color, name):
+    groups = fap_filtered_data.groupby(list(HOVER_COLUMNS), observed=True, sort=False, dropna=False).indices
+    if not groups:
+        return [fap_marker_trace(fap_filtered_data, color, name, legendgroup=name)]  # Empty, kept in the legend
+    traces = []
+    for values, positions in groups.items():
+        hovertemplate = ", ".join(str(value) for value in values) + f"<br>(%{{lat}}, %{{lon}})<extra>{name}</extra>"
+        traces.append(fap_marker_trace(fap_filtered_data.iloc[positions], color, name, legendgroup=name, showlegend=not traces,
+                                       hovertemplate=hovertemplate))
+    return traces
+
+# Function to build the trace of the FAP counts per hexagonal bin of one category
+def fap_bin_trace(category_bins, color, name, max_count):
+    return dict(
+        type="scattermapbox",
+        mode="markers",
+        lat=category_bins["lat"].to_numpy(),
+        lon=category_bins["lon"].to_numpy(),
+        marker=dict(
+            size=category_bins["count"].to_numpy(),
+            sizemode="area",
+            sizeref=2 * max_count / HEX_BIN_MARKER_SIZE ** 2,
+            sizemin=3,
+            color=color,
+            opacity=0.6,
+        ),
+        hovertemplate=f"%{{marker.size}} x {name}<extra></extra>",
+        name=f"{name}"  # Legend label for each category
+    )
+
+# Function to build the mapbox layer drawing the FAPs of one category from the tiles, named like its legend entry
+def fap_tile_layer(url, selected_state, column, value, color):
+    return dict(sourcetype="vector", source=[url], sourcelayer=fap_layer(selected_state, column, value), type="circle",
+                color=color, opacity=0.7, circle=dict(radius=TILE_CIRCLE_RADIUS), name=value)
+
+# Function to build the FAP layers of the categories shown on a tile map, with an empty trace per category as its
+# legend entry. Tile layers have no hover text.
+def fap_tile_layers(url, selected_state, column, colors, shown, empty):
+    layers, traces = [], []
+    for value, color in colors.items():
+        if value in shown:
+            layers.append(fap_tile_layer(url, selected_state, column, value, color))
+        traces.append(fap_marker_trace(empty, color, value))
+    return layers, traces
+
+# Function to add a dropdown that filters the FAP marker traces (and FAP tile layers) of a figure by category in
+# the browser. The figure must be built with every category included; base layers (boundaries, EA outlines) stay
+# visible.
+def add_category_filter_menu(fig, label):
+    traces = fig["data"]
+    layers = fig["layout"]["mapbox"]["layers"]
+    is_category = [trace["type"] == "scattermapbox" and trace.get("mode") == "markers" for trace in traces]
+    is_layer_category = ["name" in layer for layer in layers]
+    categories = list(dict.fromkeys([trace["name"] for trace, category in zip(traces, is_category) if category and len(trace["lat"])]
+                                    + [layer["name"] for layer in layers if "name" in layer]))
+
+    # Function to get the button arguments showing the traces and layers of one category (every one with None)
+    def visibility(name):
+        visible = [not category or name is None or trace["name"] == name for trace, category in zip(traces, is_category)]
+        layout = {f"mapbox.layers[{i}].visible": name is None or layer["name"] == name
+                  for i, (layer, category) in enumerate(zip(layers, is_layer_category)) if category}
+        return [{"visible": visible}, layout]
+
+    buttons = [dict(label=f"All ({label})", method="update", args=visibility(None))]
+    for name in categories:
+        buttons.append(dict(label=name, method="update", args=visibility(name)))
+    fig["layout"]["updatemenus"] = [dict(type="dropdown", buttons=buttons, active=0, x=0.01, y=0.99, xanchor="left", yanchor="top")]
+    return fig
+
+# Function to generate map for FAP functionalities
+def generate_map_fap_functionalities(selected_state, selected_fap_functionality, selection_index, state_gdf, state_geojson_data):
+    base = load_base_layers(selected_state)
+    if selected_state != 'All':
+        map_title = f"FAP FUNCTIONALITIES VISUALIZATION FOR {selected_state} - {selected_fap_functionality}"
+    else:
+        map_title = f"FAP FUNCTIONALITIES VISUALIZATION FOR NIGERIA - {selected_fap_functionality}"
+
+    # FAPs drawn from the tiles, which already thin the national view out to one point per tile coordinate
+    if base["tile_url"]:
+        shown = FAP_FUNCTIONALITY_COLORS if selected_fap_functionality == 'All' else [selected_fap_functionality]
+        layers, traces = fap_tile_layers(base["tile_url"], selected_state, 'FAP_FUNCTIONALITY',
+                                         {fap_func: color for fap_func, color in FAP_FUNCTIONALITY_COLORS.items() if fap_func in shown},
+                                         shown, selection_index.empty)
+        return compose_map(base, traces, map_title, legend_title="FAP Functionality", layers=layers)
+
+    # Aggregate the national view into hexagonal bins when there are too many FAPs to draw one by one
+    if selected_state == 'All' and len(selection_index.positions(selected_state, selected_fap_functionality)) > AGGREGATE_POINT_THRESHOLD:
+        with stage("filter"):
+            filtered_data = selection_index.select(selected_state, selected_fap_functionality)
+        fap_bins = hex_bin_counts(filtered_data["LATITUDE"], filtered_data["LONGITUDE"], filtered_data["FAP_FUNCTIONALITY"], HEX_BIN_SIZE_KM)
+        map_title += f" (FAP COUNTS PER {HEX_BIN_SIZE_KM} KM HEXAGON)"
+    else:
+        fap_bins = None
+
+    # Scatter plot for filtered data
+    traces = []
+    for fap_func, color in FAP_FUNCTIONALITY_COLORS.items():
+        if selected_fap_functionality == 'All' or fap_func == selected_fap_functionality:
+            if fap_bins is not None:
+                traces.append(fap_bin_trace(fap_bins[fap_bins["category"] == fap_func], color, fap_func, fap_bins["count"].max()))
+            else:
+                with stage("filter"):
+                    fap_filtered_data = selection_index.select(selected_state, fap_func)
+                traces += fap_marker_traces(fap_filtered_data, color, fap_func)
+
+    return compose_map(base, traces, map_title, legend_title="FAP Functionality")
+
+# Function to generate map for FAP types
+def generate_map_fap_types(selected_state, selected_fap_type, selection_index, state_gdf, state_geojson_data):
+    base = load_base_layers(selected_state)
+    if selected_state != 'All':
+        map_title = f"FAP TYPES VISUALIZATION FOR {selected_state}"
+    else:
+        map_title = f"FAP TYPES VISUALIZATION FOR NIGERIA"
+
+    # FAPs drawn from the tiles (types other than the selected one stay in the legend, without layer)
+    if base["tile_url"]:
+        shown = FAP_TYPE_COLORS if selected_fap_type == 'All' else [selected_fap_type]
+        layers, traces = fap_tile_layers(base["tile_url"], selected_state, 'FAP_TYPE', FAP_TYPE_COLORS, shown, selection_index.empty)
+        return compose_map(base, traces, map_title, legend_title="FAP Type", layers=layers)
+
+    # Aggregate the national view into hexagonal bins when there are too many FAPs to draw one by one
+    if selected_state == 'All' and len(selection_index.positions(selected_state, fap_type=selected_fap_type)) > AGGREGATE_POINT_THRESHOLD:
+        with stage("filter"):
+            filtered_data = selection_index.select(selected_state, fap_type=selected_fap_type)
+        fap_bins = hex_bin_counts(filtered_data["LATITUDE"], filtered_data["LONGITUDE"], filtered_data["FAP_TYPE"], HEX_BIN_SIZE_KM)
+        map_title += f" (FAP COUNTS PER {HEX_BIN_SIZE_KM} KM HEXAGON)"
+    else:
+        fap_bins = None
+
+    # Add scatter plot for filtered data (types other than the selected one stay in the legend, empty)
+    traces = []
+    for fap_type, color in FAP_TYPE_COLORS.items():
+        if fap_bins is not None:
+            traces.append(fap_bin_trace(fap_bins[fap_bins["category"] == fap_type], color, fap_type, fap_bins["count"].max()))
+            continue
+        if selected_fap_type == 'All' or fap_type == selected_fap_type:
+            with stage("filter"):
+                fap_filtered_data = selection_index.select(selected_state, fap_type=fap_type)
+        else:
+            fap_filtered_data = selection_index.empty
+        traces += fap_marker_traces(fap_filtered_data, color, fap_type)
+
+    return compose_map(base, traces, map_title, legend_title="FAP Type")
+
+# Function to calculate average proximity for each EA of a state, from the aggregate cube
+def calculate_average_proximity(aggregate_cube, selected_state, selected_fap_type):
+    # Roll the cells of the selected state and FAP type up to EAs and take the average proximity of each EA
+    ea_cells = aggregate_cube.rollup(['EA NAME'], {'STATE': selected_state, 'FAP_TYPE': selected_fap_type})
+    avg_proximity_per_ea = ea_cells['km_mean'].rename('KM Diff Calculation').reset_index()
+
+    return avg_proximity_per_ea
+
+# With ea_proximity_data (from load_ea_proximity) states are coloured by the mean distance from their EAs to the
+# nearest FAP of the type, instead of the mean surveyed FAP-to-EA distance
+def generate_km_diff_heatmap(state_gdf, state_geojson_data, aggregate_cube, selected_fap_type, selected_state=None, ea_proximity_data=None):
+    # Every state is drawn on the national view, coloured by its value instead of the plain boundary layer
+    base = load_base_layers('All')
+
+    if ea_proximity_data is None:
+        title = "Heatmap of average proximity to FAP in KM"
+
+        # Roll the cube up to states for the selected FAP type (and selected state, if any) and take the average KM Diff
+        with stage("filter"):
+            state_cells = aggregate_cube.rollup(['STATE'], {'STATE': selected_state, 'FAP_TYPE': selected_fap_type})
+        avg_km_diff_by_state = state_cells['km_mean'].rename('KM Diff Calculation').reset_index()
+    else:
+        title = "Heatmap of average distance from EA to nearest FAP in KM"
+
+        # Filter EAs by selected state, if any
+        if selected_state:
+            with stage("filter"):
+                ea_proximity_data = ea_proximity_data[ea_proximity_data['STATE'] == selected_state]
+
+        # Group EAs by state and calculate average distance to the nearest FAP for each state
+        avg_km_diff_by_state = ea_proximity_data.groupby('STATE')['Nearest FAP (km)'].mean().rename('KM Diff Calculation').reset_index()
+
+    # Merge average data with state GeoDataFrame, filling states without data with 0
+    merged_data = state_gdf.merge(avg_km_diff_by_state, how='left', left_on='admin1Name', right_on='STATE')
+    merged_data['KM Diff Calculation'] = merged_data['KM Diff Calculation'].fillna(0)
+
+    traces = [
+        # Choropleth of all states coloured by average Km_Diff_Calculation (same index as the base GeoJSON)
+        dict(
+            type="choroplethmapbox",
+            subplot="mapbox",
+            geojson=base["geojson"],
+            locations=merged_data.index.tolist(),
+            z=merged_data['KM Diff Calculation'].to_numpy(),
+            coloraxis="coloraxis",
+            marker=dict(opacity=0.5),
+            hovertemplate="index=%{location}<br>KM Diff Calculation=%{z}<extra></extra>",
+            name="",
+        ),
+        # The average of every state as text at its centroid, in one trace
+        dict(
+            type="scattermapbox",
+            lat=merged_data["centroid_lat"].to_numpy(),
+            lon=merged_data["centroid_lon"].to_numpy(),
+            mode="text",
+            textfont=dict(color="black", size=15),
+            text=merged_data["KM Diff Calculation"].round(2).astype(str).to_numpy(),
+            showlegend=False
+        ),
+    ]
+
+    # Color range from 0 to the highest state average
+    coloraxis = dict(
+        colorbar=dict(title=dict(text='KM Diff Calculation')),
+        colorscale=plotly.colors.get_colorscale("greens"),
+        cmin=0,
+        cmax=float(merged_data['KM Diff Calculation'].max()),
+    )
+
+    return compose_map(base, traces, title, layout=dict(coloraxis=coloraxis), boundaries=False)
+
+# Function to generate the map of the location checks of the FAPs of a state, showing every check or one of them
+def generate_map_location_checks(selected_state, selected_check, location_checks):
+    base = load_base_layers(selected_state)
+    if selected_state != 'All':
+        map_title = f"FAP LOCATION CHECKS FOR {selected_state} - {selected_check}"
+    else:
+        map_title = f"FAP LOCATION CHECKS FOR NIGERIA - {selected_check}"
+
+    with stage("filter"):
+        if selected_state != 'All':
+            location_checks = location_checks[location_checks['STATE'] == selected_state]
+
+    # One trace per check, with the surveyed and the geometric state, EA and FAP location in the hover text
+    traces = []
+    for check, color in LOCATION_CHECK_COLORS.items():
+        if selected_check != 'All' and check != selected_check:
+            continue
+        rows = location_checks[location_checks['LOCATION CHECK'] == check]
+        surveyed = rows['STATE'].astype(str) + ', ' + rows['EA NAME'].astype(str) + ', ' + rows['FAP_LOCATION'].astype(str)
+        located = (rows['GEO STATE'].astype(object).fillna('-').astype(str) + ', ' + rows['GEO EA NAME'].astype(object).fillna('-').astype(str)
+                   + ', ' + rows['GEO FAP_LOCATION'].astype(object).fillna('-').astype(str))
+        traces.append(fap_marker_trace(rows, color, check, hovertext=("Surveyed: " + surveyed + "<br>Located: " + located).tolist()))
+
+    return compose_map(base, traces, map_title, legend_title="Location Check")
+
+# Function to generate the map of a state's coverage surface (see fap_coverage): the distance to the nearest FAP of
+# every grid cell as an image layer, with the distance of a sample of the cells on hover
+def generate_map_coverage(selected_state, selected_fap_type, active_only, surface):
+    from fap_coverage import COVERAGE_COLORSCALE, COVERAGE_MAX_KM, coverage_image_uri
+
+    base = load_base_layers(selected_state)
+    fap_label = f"{'ACTIVE ' if active_only else ''}FAP" + ("" if selected_fap_type == 'All' else f" ({selected_fap_type})")
+    map_title = f"DISTANCE TO THE NEAREST {fap_label} IN {selected_state} ({surface.resolution_km:g} KM GRID)"
+
+    # The surface as a PNG stretched over its grid bounds (corners from the top left, clockwise), below the traces
+    west, south, east, north = surface.bounds
+    image = dict(sourcetype="image", source=coverage_image_uri(surface), coordinates=[[west, north], [east, north], [east, south], [west, south]],
+                 below="traces")
+
+    # Invisible markers on every stride-th cell of the state: hover text and colour bar of the image
+    stride = max(1, int(np.ceil(np.sqrt(surface.distances.size / COVERAGE_HOVER_POINTS))))
+    lat, lon = (coordinates[::stride, ::stride] for coordinates in surface.cell_coordinates())
+    km = surface.distances[::stride, ::stride]
+    shown = ~np.isnan(km)
+    hover = dict(
+        type="scattermapbox",
+        mode="markers",
+        lat=survey_coordinates(lat[shown]),
+        lon=survey_coordinates(lon[shown]),
+        marker=dict(size=8, opacity=0, color=np.minimum(km[shown], COVERAGE_MAX_KM).round(2), coloraxis="coloraxis"),
+        customdata=np.where(np.isfinite(km[shown]), km[shown], np.nan).round(2),
+        hovertemplate="%{customdata} km<extra></extra>",
+        showlegend=False,
+    )
+    coloraxis = dict(
+        colorbar=dict(title=dict(text='KM to nearest FAP')),
+        colorscale=plotly.colors.get_colorscale(COVERAGE_COLORSCALE),
+        cmin=0,
+        cmax=COVERAGE_MAX_KM,
+    )
+
+    return compose_map(base, [hover], map_title, layout=dict(coloraxis=coloraxis), boundaries=False, layers=[image])
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import streamlit as st
+
+# Structured log lines (one JSON object per script rerun) go to the "a2f" logger, on stderr unless the
+# deployment configures handlers of its own
+logger = logging.getLogger("a2f")
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+profile_logger = logging.getLogger("a2f.profile")
+
+# The diagnostics sidebar section is shown with ?diagnostics=1 in the URL, or for every session with A2F_DIAGNOSTICS=1
+DIAGNOSTICS_ENV = "A2F_DIAGNOSTICS"
+DIAGNOSTICS_QUERY_PARAM = "diagnostics"
+
+# Every Streamlit script run has its own thread, so the profile of the running rerun is kept per thread
+_current = threading.local()
+
+
+# Timings, counters and annotations of one script rerun. Stage times are exclusive: time spent in a stage
+# nested inside another (e.g. filtering while building a figure) is only counted for the inner stage.
+class RerunProfile:
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.total = None
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.fields = {}
+        self._stack = []
+
+    # Function to time a stage of the rerun (repeated stages add up)
+    @contextmanager
+    def stage(self, name):
+        frame = [0.0]  # Time spent in nested stages
+        self._stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stack.pop()
+            self.stages[name] += elapsed - frame[0]
+            if self._stack:
+                self._stack[-1][0] += elapsed
+
+    # Function to add to a counter (cache hits and misses, payload bytes, ...)
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    # Function to record what the rerun rendered (selected state, filters, ...)
+    def annotate(self, **fields):
+        self.fields.update(fields)
+
+    # Function to stop the rerun clock
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    # Function to get the profile as a JSON-serializable dict (times in milliseconds)
+    def as_dict(self):
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        stages_ms = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        stages_ms["other"] = round(max(total * 1000 - sum(stages_ms.values()), 0), 2)
+        return dict(event="rerun", page=self.page, total_ms=round(total * 1000, 2), stages_ms=stages_ms,
+                    counters=dict(self.counters), **self.fields)
+
+
+# Function to start profiling the rerun of the current thread
+def start_profile(page):
+    _current.profile = RerunProfile(page)
+    return _current.profile
+
+# Function to get the profile of the rerun of the current thread (None outside a profiled rerun, e.g. in the
+# warm-up thread or in scripts)
+def current_profile():
+    return getattr(_current, "profile", None)
+
+# Function to time a stage of the current rerun; a no-op outside a profiled rerun
+@contextmanager
+def stage(name):
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+# Function to add to a counter of the current rerun; a no-op outside a profiled rerun
+def count(name, value=1):
+    profile = current_profile()
+    if profile is not None:
+        profile.count(name, value)
+
+# Function to record fields of the current rerun; a no-op outside a profiled rerun
+def annotate(**fields):
+    profile = current_profile()
+    if profile is not None:
+        profile.annotate(**fields)
+
+# Function to finish the profile of the current rerun and write it as one structured log line
+def finish_profile():
+    profile = current_profile()
+    if profile is None:
+        return None
+    _current.profile = None
+    profile.finish()
+    profile_logger.info(json.dumps(profile.as_dict(), default=str))
+    return profile
+
+# Function to check whether the diagnostics sidebar section is enabled for this session
+def diagnostics_enabled():
+    return os.environ.get(DIAGNOSTICS_ENV) == "1" or st.query_params.get(DIAGNOSTICS_QUERY_PARAM) == "1"
+
+# Function to show a finished rerun profile, and the process-wide figure cache statistics, in the sidebar
+def show_diagnostics(profile, figure_cache=None):
+    profile_data = profile.as_dict()
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        st.write(f"Rerun: {profile_data['total_ms']:.1f} ms")
+        st.table({"Stage": list(profile_data["stages_ms"]), "ms": list(profile_data["stages_ms"].values())})
+        if profile_data["counters"]:
+            st.table({"Counter": list(profile_data["counters"]), "Value": list(profile_data["counters"].values())})
+        if figure_cache is not None:
+            st.write(f"Figure cache: {len(figure_cache)} figures, {figure_cache.size_bytes / 2 ** 20:.1f} MB, "
+                     f"{figure_cache.hits} hits / {figure_cache.misses} misses")
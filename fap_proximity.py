@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from fap_data import EARTH_RADIUS_KM
+
+# Columns needed to index FAP points and locate EA centroids
+NEAREST_COLUMNS = ('STATE', 'FAP_TYPE', 'FAP_FUNCTIONALITY', 'EA NAME', 'LATITUDE', 'LONGITUDE', 'EA.LATITUDE', 'EA.LONGITUDE')
+
+# Defaults for the proximity metrics reported per EA
+NEAREST_K = 3
+PROXIMITY_RADIUS_KM = 2.0
+
+# Function to convert coordinates (degrees) into 3D points on the unit sphere. Euclidean (chord) distance between
+# these points is monotonic in great-circle distance, so a k-d tree over them answers haversine nearest-neighbour queries.
+def unit_vectors(lat, lon):
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+# Function to convert chord lengths on the unit sphere into great-circle distances in km. Infinite chords (the
+# k-d tree's missing neighbours) stay infinite.
+def chord_to_km(chord):
+    chord = np.asarray(chord, dtype=np.float64)
+    return np.where(np.isinf(chord), np.inf, 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1)))
+
+# Function to convert great-circle distances in km into chord lengths on the unit sphere
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=np.float64) / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+# Function to build one k-d tree over every FAP ('All') plus one per FAP_TYPE
+def fap_trees(data):
+    trees = {'All': cKDTree(unit_vectors(data['LATITUDE'], data['LONGITUDE']))}
+    for fap_type, group in data.groupby('FAP_TYPE', observed=True):
+        trees[fap_type] = cKDTree(unit_vectors(group['LATITUDE'], group['LONGITUDE']))
+    return trees
+
+# Spatial index over FAP points: one k-d tree per FAP_TYPE plus one over every FAP ('All'), over every FAP and over
+# the active ones only, built once per data version. Queries take arrays of coordinates and run in bulk (O(log n)
+# per query point), never looping over EA x FAP pairs.
+class NearestFapIndex:
+    def __init__(self, data):
+        data = data.dropna(subset=['LATITUDE', 'LONGITUDE'])
+        self.trees = fap_trees(data)
+        self.active_trees = fap_trees(data[data['FAP_FUNCTIONALITY'] == 'Active'])
+
+    # Function to get the tree of the FAPs of a type (None when there is none)
+    def tree(self, fap_type, active_only=False):
+        tree = (self.active_trees if active_only else self.trees).get(fap_type)
+        return tree if tree is not None and tree.n else None
+
+    # Function to get the distances in km from every query point to its k nearest FAPs of a type, shape (n, k).
+    # Missing neighbours (fewer than k FAPs of the type) are inf.
+    def nearest_km(self, fap_type, lat, lon, k=1, active_only=False):
+        tree = self.tree(fap_type, active_only)
+        if tree is None:
+            return np.full((len(lat), k), np.inf)
+        chord, _ = tree.query(unit_vectors(lat, lon), k=k)
+        return chord_to_km(chord.reshape(len(lat), k))
+
+    # Function to count the FAPs of a type within radius_km of every query point
+    def count_within_km(self, fap_type, lat, lon, radius_km, active_only=False):
+        tree = self.tree(fap_type, active_only)
+        if tree is None:
+            return np.zeros(len(lat), dtype=np.int64)
+        return tree.query_ball_point(unit_vectors(lat, lon), km_to_chord(radius_km), return_length=True)
+
+
+# Function to get one centroid per EA (STATE, EA NAME, EA.LATITUDE, EA.LONGITUDE) from the survey data
+def ea_centroids(data):
+    columns = ['STATE', 'EA NAME', 'EA.LATITUDE', 'EA.LONGITUDE']
+    return data[columns].dropna().drop_duplicates(['STATE', 'EA NAME']).reset_index(drop=True)
+
+# Function to compute the proximity of every EA to FAPs of a type: nearest FAP, mean of the k nearest and
+# the number of FAPs within a radius
+def ea_proximity(index, eas, fap_type, k=NEAREST_K, radius_km=PROXIMITY_RADIUS_KM):
+    lat, lon = eas['EA.LATITUDE'].to_numpy(), eas['EA.LONGITUDE'].to_numpy()
+    nearest = index.nearest_km(fap_type, lat, lon, k)
+    nearest = np.where(np.isfinite(nearest), nearest, np.nan)  # NaN when there are fewer than k FAPs of the type
+    return pd.DataFrame({
+        'STATE': eas['STATE'].to_numpy(),
+        'EA NAME': eas['EA NAME'].to_numpy(),
+        'Nearest FAP (km)': nearest[:, 0],
+        f'Mean of {k} nearest (km)': nearest.mean(axis=1),
+        f'FAPs within {radius_km:g} km': index.count_within_km(fap_type, lat, lon, radius_km),
+    })
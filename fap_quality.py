@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from fap_geo import ea_polygons, state_key
+
+# Columns the location checks read (and the map of their results shows)
+QUALITY_COLUMNS = ('STATE', 'EA NAME', 'FAP_LOCATION', 'FAP_TYPE', 'FORMALITY', 'FAP_FUNCTIONALITY', 'LATITUDE', 'LONGITUDE')
+
+# Result of the location check of a FAP, in the order the checks run (a FAP gets the first check it fails)
+LOCATION_CHECKS = ('No coordinates', 'Outside Nigeria', 'Other state', 'Inside/Outside EA mismatch', 'EA not mapped', 'OK')
+
+# Function to get the key an EA polygon is matched by: its state and name, normalized like state keys
+def ea_key(state_name, ea_name):
+    return f"{state_key(str(state_name))}/{state_key(str(ea_name))}"
+
+
+# STR-tree over polygons labelled by name (and matching key), queried with arrays of points in bulk: the tree
+# narrows each point down to the few polygons whose bounding box holds it before any exact test, so checking
+# every FAP against every EA polygon of the country takes well under a second.
+class PolygonIndex:
+    def __init__(self, polygons, names, keys=None):
+        self.tree = shapely.STRtree(polygons)
+        self.names = np.asarray(names, dtype=object)
+        self.keys = self.names if keys is None else np.asarray(keys, dtype=object)
+
+    # Function to find the polygons holding every point (boundaries included) as parallel arrays of
+    # (point position, polygon position), sorted by point
+    def query(self, lat, lon):
+        points = shapely.points(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+        return self.tree.query(points, predicate="intersects")
+
+    # Function to get the name of the polygon holding every point (None outside every polygon). A point on a
+    # boundary shared by several polygons gets the first of them.
+    def locate(self, lat, lon):
+        point_index, polygon_index = self.query(lat, lon)
+        names = np.full(len(lat), None, dtype=object)
+        names[point_index[::-1]] = self.names[polygon_index[::-1]]
+        return names
+
+# Function to index the state boundaries by state name
+def state_polygon_index(state_gdf):
+    return PolygonIndex(shapely.force_2d(state_gdf.geometry.values), state_gdf['admin1Name'].to_numpy())
+
+# Function to index the EA polygons of every state (state name -> EA polygon GeoJSON) by EA name
+def ea_polygon_index(polygon_geojson_by_state):
+    polygons, names, keys = [np.empty(0, dtype=object)], [], []
+    for state_name, polygon_geojson_data in polygon_geojson_by_state.items():
+        if not polygon_geojson_data["features"]:
+            continue
+        state_polygons, feature_index = ea_polygons(polygon_geojson_data)
+        ea_names = [feature["properties"].get("EA_NAME") for feature in polygon_geojson_data["features"]]
+        polygons.append(state_polygons)
+        names += [ea_names[i] for i in feature_index]
+        keys += [ea_key(state_name, ea_names[i]) for i in feature_index]
+    return PolygonIndex(np.concatenate(polygons), names, keys)
+
+# Function to check the location of every FAP against the geometry: the state and EA holding its coordinates,
+# whether it lies inside the polygon of its surveyed EA (recomputed FAP_LOCATION, None when the EA has no polygon)
+# and the first check it fails (LOCATION_CHECKS). Returns a DataFrame aligned with the data.
+def check_locations(data, state_index, ea_index):
+    lat, lon = data['LATITUDE'].to_numpy(dtype=np.float64), data['LONGITUDE'].to_numpy(dtype=np.float64)
+    geo_state = state_index.locate(lat, lon)
+    geo_ea = ea_index.locate(lat, lon)
+
+    # Key of every FAP's surveyed EA (computed once per distinct EA), and whether the FAP lies in one of its polygons
+    codes, surveyed = pd.factorize(pd.MultiIndex.from_arrays([data['STATE'].astype(str), data['EA NAME'].astype(str)]))
+    surveyed_keys = np.asarray([ea_key(state_name, ea_name) for state_name, ea_name in surveyed], dtype=object)[codes]
+    point_index, polygon_index = ea_index.query(lat, lon)
+    inside = np.zeros(len(data), dtype=bool)
+    inside[point_index[ea_index.keys[polygon_index] == surveyed_keys[point_index]]] = True
+    mapped = np.isin(surveyed_keys, ea_index.keys)
+    geo_location = np.where(mapped, np.where(inside, 'Inside EA', 'Outside EA'), None)
+
+    surveyed_states = data['STATE'].astype(str)
+    state_keys = {name: state_key(name) for name in set(state_index.names) | set(surveyed_states.unique())}
+    other_state = pd.notna(geo_state) & (pd.Series(geo_state).map(state_keys).to_numpy() != surveyed_states.map(state_keys).to_numpy())
+    check = np.select(
+        [~(np.isfinite(lat) & np.isfinite(lon)), pd.isna(geo_state), other_state,
+         mapped & (geo_location != data['FAP_LOCATION'].astype(str).to_numpy()), ~mapped],
+        LOCATION_CHECKS[:-1], LOCATION_CHECKS[-1],
+    )
+    return pd.DataFrame({
+        'GEO STATE': geo_state,
+        'GEO EA NAME': geo_ea,
+        'GEO FAP_LOCATION': geo_location,
+        'LOCATION CHECK': pd.Categorical(check, categories=LOCATION_CHECKS),
+    }, index=data.index)
+
+# Function to count the FAPs of every state by location check, with a total row
+def quality_report(checked):
+    report = pd.crosstab(checked['STATE'], checked['LOCATION CHECK'], dropna=False)
+    report = report.reindex(columns=list(LOCATION_CHECKS), fill_value=0)
+    report.loc['Total'] = report.sum()
+    return report
@@ -0,0 +1,80 @@
+import glob
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+
+from fap_data import shared_dir
+
+# Shared data plane: with A2F_SHARED_DIR set (e.g. /dev/shm/a2f, a RAM-backed directory), the immutable datasets
+# of the app are written once per version as uncompressed Arrow IPC files and every server process memory-maps
+# them read-only. Numeric columns and the codes of categorical columns are views into the page cache shared by
+# all processes, so adding server processes does not add copies of the survey data. EA polygons are shared the
+# same way through the memory-mapped geo asset bundle (python fap_geo.py). The mode is switched on by
+# A2F_SHARED_DIR (fap_data.shared_dir), without importing pyarrow when it is off.
+
+# Function to get the shared file of a version of a dataset, e.g. /dev/shm/a2f/A2F_FAP_v1-3f2a9c1b7d04.arrow
+def shared_path(dataset, version):
+    return os.path.join(shared_dir(), f"{dataset}-{version}.arrow")
+
+# Function to convert a DataFrame into an Arrow table that converts back without copies: string columns are
+# dictionary-encoded (read back as categoricals) and NaN stays a float value instead of becoming a null
+def frame_to_table(data):
+    arrays = []
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays.append(pa.array(values))
+        elif values.dtype == object:
+            strings = pa.array(values, from_pandas=True)
+            if pa.types.is_null(strings.type):
+                strings = strings.cast(pa.string())  # Column without any value
+            arrays.append(strings.dictionary_encode())
+        else:
+            arrays.append(pa.array(values.to_numpy()))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in data.columns])
+
+# Function to convert a GeoDataFrame into an Arrow table, its geometry as WKB
+def gdf_to_table(gdf):
+    table = frame_to_table(pd.DataFrame(gdf.drop(columns=gdf.geometry.name)))
+    return table.append_column(gdf.geometry.name, pa.array(shapely.to_wkb(gdf.geometry.values), type=pa.binary()))
+
+# Function to write a dataset version into the shared directory once, built by build_table on the first call.
+# Processes racing to publish write their own temporary file and the last rename wins (same content). Older
+# versions of the dataset are removed; processes still attached to them keep their mapping until they let go.
+def publish(dataset, version, build_table):
+    file_path = shared_path(dataset, version)
+    if not os.path.exists(file_path):
+        os.makedirs(shared_dir(), exist_ok=True)
+        table = build_table()
+        temporary_path = f"{file_path}.{os.getpid()}.tmp"
+        with pa.OSFile(temporary_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temporary_path, file_path)
+        for old_path in glob.glob(shared_path(dataset, "*")):
+            if old_path != file_path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+    return file_path
+
+# Function to memory-map a published dataset read-only; the table's buffers point into the mapping
+def attach(file_path):
+    return pa.ipc.open_file(pa.memory_map(file_path, "r")).read_all()
+
+# Function to get columns of an attached table as a DataFrame of views into the mapping (only the categories
+# of categorical columns are copied). Callers must treat the frame as read-only.
+def table_to_frame(table, columns=None):
+    if columns is not None:
+        table = table.select(list(columns))
+    return table.to_pandas(split_blocks=True)
+
+# Function to get an attached GeoDataFrame table back as a GeoDataFrame (the geometries are rebuilt per process)
+def table_to_gdf(table, geometry="geometry", crs="EPSG:4326"):
+    data = table_to_frame(table.drop_columns([geometry]))
+    return gpd.GeoDataFrame(data, geometry=shapely.from_wkb(np.asarray(table.column(geometry).to_pylist(), dtype=object)), crs=crs)
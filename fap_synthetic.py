@@ -0,0 +1,64 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from fap_data import CSV_PATH, convert_csv_to_store
+
+# Scale factors the benchmarks are run at
+SCALE_FACTORS = (10, 100, 1000)
+
+# Spread of the synthetic copies, in degrees: every copy of an EA is moved as a whole by up to EA_SHIFT_DEGREES and
+# every FAP is moved by about FAP_JITTER_DEGREES around its (moved) position
+EA_SHIFT_DEGREES = 0.05
+FAP_JITTER_DEGREES = 0.005
+
+# Function to get the path of the synthetic copy of a CSV scaled by a factor, e.g. synthetic/A2F_FAP_v1_x10.csv
+def synthetic_path(csv_path, factor, output_dir="synthetic"):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(output_dir, f"{name}_x{factor}.csv")
+
+# Function to make one synthetic copy of the survey data: new InstanceIDs and EA codes/names, EAs shifted as a
+# whole and FAPs jittered around them. Copy 0 is the survey data itself.
+def synthetic_copy(data, copy, rng):
+    if copy == 0:
+        return data
+    data = data.copy()
+    data['InstanceID'] = data['InstanceID'] + copy * (int(data['InstanceID'].max()) + 1)
+    data['EA'] = data['EA'].astype(str) + f"-{copy}"
+    data['EA NAME'] = data['EA NAME'].astype(str) + f" #{copy}"
+
+    # One shift per EA, so the rows of an EA keep sharing its coordinates
+    ea_codes = data['EA'].factorize()[0]
+    shift = rng.uniform(-EA_SHIFT_DEGREES, EA_SHIFT_DEGREES, size=(ea_codes.max() + 1, 2))[ea_codes]
+    for column, axis in (('EA.LATITUDE', 0), ('EA.Latitude', 0), ('LATITUDE', 0), ('EA.LONGITUDE', 1), ('EA.Longitude', 1), ('LONGITUDE', 1)):
+        data[column] = data[column] + shift[:, axis]
+    data['LATITUDE'] = data['LATITUDE'] + rng.normal(0, FAP_JITTER_DEGREES, len(data))
+    data['LONGITUDE'] = data['LONGITUDE'] + rng.normal(0, FAP_JITTER_DEGREES, len(data))
+    return data
+
+# Function to write the survey data scaled by a factor (factor copies of every row), one copy at a time so
+# memory stays at the size of the survey data whatever the factor. Optionally builds the columnar store too.
+def write_synthetic_csv(factor, csv_path=CSV_PATH, output_path=None, seed=0, store=False):
+    output_path = output_path or synthetic_path(csv_path, factor)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    data = pd.read_csv(csv_path, encoding="utf-8-sig")
+    rng = np.random.default_rng(seed)
+    for copy in range(factor):
+        synthetic_copy(data, copy, rng).to_csv(output_path, mode="w" if copy == 0 else "a", header=copy == 0, index=False)
+    if store:
+        convert_csv_to_store(output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic copies of the FAP survey CSV scaled by the given factors.")
+    parser.add_argument("factors", nargs="*", type=int, default=list(SCALE_FACTORS))
+    parser.add_argument("--csv", default=CSV_PATH, help="Survey CSV to scale")
+    parser.add_argument("--output-dir", default="synthetic")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", action="store_true", help="Also build the columnar store of every synthetic CSV")
+    args = parser.parse_args()
+    for factor in args.factors:
+        print(f"Wrote {write_synthetic_csv(factor, args.csv, synthetic_path(args.csv, factor, args.output_dir), args.seed, args.store)}")
@@ -0,0 +1,403 @@
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import math
+import os
+import threading
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from fap_data import CSV_PATH, MAP_COLUMNS, data_version, read_fap_data
+from fap_geo import POLYGONS_DIR, STATE_GEOJSON_PATH, ea_polygons, read_geojson, state_key
+
+# Local vector tile service: the state boundaries, the EA polygons of every state and the FAP points are cut into
+# Mapbox Vector Tiles (spec v2) per zoom level and served over HTTP, so maps reference them as mapbox layers and
+# the browser fetches only the tiles in view. Tiles live under a version of their inputs (survey data, geo files),
+# so their URLs never change content and are cached by the browser for good. Low zooms are built up front
+# (python fap_tiles.py build); the server cuts and caches deeper tiles on first request.
+
+# Set A2F_TILE_URL to the address of a running tile server (e.g. http://localhost:8765) to draw EAs and FAPs from tiles
+TILE_URL_ENV = "A2F_TILE_URL"
+TILES_DIR = "tiles"
+TILE_SERVER_PORT = 8765
+
+# Tile geometry: coordinates per tile side, and the margin (in tile coordinates) polygons are clipped with so
+# that fills and outlines do not show seams at tile edges
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+BUILD_ZOOMS = range(4, 11)  # Built up front
+MAX_ZOOM = 16  # Deepest zoom the server cuts on request
+EA_MIN_ZOOM = 7  # EA outlines are drawn from this map zoom on
+
+# Web Mercator (EPSG:3857) extent in metres
+MERCATOR_RADIUS = 6378137.0
+MERCATOR_HALF_WORLD = math.pi * MERCATOR_RADIUS
+MERCATOR_MAX_LATITUDE = 85.0511287798
+
+# Survey columns FAP points are layered by, so every category of a map is one layer it can style
+FAP_LAYER_COLUMNS = ('FAP_FUNCTIONALITY', 'FAP_TYPE')
+FAP_PROPERTY_COLUMNS = ('STATE', 'FAP_TYPE', 'FORMALITY', 'FAP_FUNCTIONALITY')
+
+# Browsers keep a tile for a year: a tile URL always holds the same content
+TILE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+TILE_VERSION_CHECK_SECONDS = 5
+
+# Function to get the tile layer of the FAPs of one category for a state ('All' for the whole country)
+def fap_layer(selected_state, column, value):
+    return f"faps {state_key(selected_state)} {column} {value}"
+
+# Function to get a version stamp of the tile inputs (survey data, state boundaries, EA polygons, tile format)
+def tile_version(csv_path=CSV_PATH, polygons_dir=POLYGONS_DIR):
+    stamps = [data_version(csv_path), f"extent={TILE_EXTENT}"]
+    for path in [STATE_GEOJSON_PATH] + sorted(os.path.join(polygons_dir, name) for name in os.listdir(polygons_dir) if name.endswith(".geojson")):
+        stat = os.stat(path)
+        stamps.append(f"{path}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha1("|".join(stamps).encode("utf-8")).hexdigest()[:12]
+
+# Function to get the tile URL template maps reference, or None when no tile server is configured
+def tile_url(csv_path=CSV_PATH):
+    base_url = os.environ.get(TILE_URL_ENV)
+    if not base_url:
+        return None
+    return f"{base_url.rstrip('/')}/{tile_version(csv_path)}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+# Protocol buffer encoding of the vector tile messages (vector_tile.proto, version 2)
+
+# Function to encode one unsigned varint
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+# Function to encode an array of unsigned integers as packed varints, vectorized over the array
+def _varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35):
+        sizes += values >= np.uint64(1 << shift)
+    starts = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max())):
+        has_byte = sizes > k
+        byte = (values[has_byte] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(sizes[has_byte] > k + 1, 0x80, 0).astype(np.uint64)
+        out[starts[has_byte] + k] = byte
+    return out.tobytes()
+
+# Function to encode a length-delimited field
+def _bytes_field(number, payload):
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+# Function to encode a varint field
+def _uint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+# Function to zigzag-encode signed integers (small magnitudes become small varints)
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+# Function to get a geometry command integer (MoveTo 1, LineTo 2, ClosePath 7) repeated count times
+def _command(command_id, count):
+    return command_id | count << 3
+
+# Function to encode the geometry of a point feature at integer tile coordinates
+def point_geometry(x, y):
+    return np.concatenate(([_command(1, 1)], _zigzag([x, y])))
+
+# Function to encode the geometry of a polygon feature from its rings (integer tile coordinates, not repeating
+# the first vertex at the end): exterior rings wind clockwise on screen (positive area), holes the other way
+def polygon_geometry(rings):
+    parts, cursor = [], np.zeros(2, dtype=np.int64)
+    for ring in rings:
+        deltas = _zigzag(np.diff(np.vstack((cursor, ring)), axis=0)).ravel()
+        cursor = ring[-1]
+        parts += [[_command(1, 1)], deltas[:2], [_command(2, len(ring) - 1)], deltas[2:], [_command(7, 1)]]
+    return np.concatenate(parts)
+
+# Function to get the signed area of a ring (shoelace): positive when it winds clockwise on screen (y down), the
+# winding of exterior rings in vector tiles
+def ring_area(coords):
+    x, y = coords[:, 0], coords[:, 1]
+    return (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+# Features of one tile layer, with the property keys and values they share
+class TileLayer:
+    def __init__(self, name):
+        self.name = name
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    # Function to encode the tags of string properties (indices into the layer's keys and values)
+    def _tags(self, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None or value != value:
+                continue
+            tags += [self.keys.setdefault(key, len(self.keys)), self.values.setdefault(str(value), len(self.values))]
+        return _bytes_field(2, _varints(tags))
+
+    # Function to add a feature (geometry type 1 point, 3 polygon) with string properties
+    def add(self, geometry_type, geometry, properties):
+        self.features.append(self._tags(properties) + _uint_field(3, geometry_type) + _bytes_field(4, _varints(geometry)))
+
+    # Function to add point features sharing their properties, from integer tile coordinates (shape (n, 2))
+    def add_points(self, coords, properties):
+        prefix = self._tags(properties) + _uint_field(3, 1)
+        move_to = _varint(_command(1, 1))
+        self.features += [prefix + _bytes_field(4, move_to + _varint(x) + _varint(y)) for x, y in _zigzag(coords).tolist()]
+
+    # Function to encode the layer message
+    def encode(self):
+        parts = [_uint_field(15, 2), _bytes_field(1, self.name.encode("utf-8"))]
+        parts += [_bytes_field(2, feature) for feature in self.features]
+        parts += [_bytes_field(3, key.encode("utf-8")) for key in self.keys]
+        parts += [_bytes_field(4, _bytes_field(1, value.encode("utf-8"))) for value in self.values]
+        parts.append(_uint_field(5, TILE_EXTENT))
+        return b"".join(parts)
+
+
+# Function to project coordinates (lon, lat in degrees, shape (n, 2)) to Web Mercator metres
+def to_mercator(coords):
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MERCATOR_MAX_LATITUDE, MERCATOR_MAX_LATITUDE)
+    return np.column_stack((np.radians(lon) * MERCATOR_RADIUS, np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * MERCATOR_RADIUS))
+
+# Function to get the Web Mercator bounds (minx, miny, maxx, maxy) of a tile
+def tile_bounds(z, x, y):
+    size = 2 * MERCATOR_HALF_WORLD / 2 ** z
+    minx, maxy = -MERCATOR_HALF_WORLD + x * size, MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+# Function to list the tiles (x, y) of a zoom covering Web Mercator bounds
+def tiles_covering(bounds, z):
+    size = 2 * MERCATOR_HALF_WORLD / 2 ** z
+    minx, miny, maxx, maxy = bounds
+    xs = range(int((minx + MERCATOR_HALF_WORLD) // size), int((maxx + MERCATOR_HALF_WORLD) // size) + 1)
+    ys = range(int((MERCATOR_HALF_WORLD - maxy) // size), int((MERCATOR_HALF_WORLD - miny) // size) + 1)
+    return [(x, y) for x in xs for y in ys]
+
+
+# The tile inputs, projected and indexed once: polygons and points are found per tile with STR-trees, then
+# clipped, simplified to a tile coordinate and encoded. One instance serves every tile of a version.
+class TileSource:
+    def __init__(self, csv_path=CSV_PATH, polygons_dir=POLYGONS_DIR):
+        self.version = tile_version(csv_path, polygons_dir)
+
+        states = gpd.GeoDataFrame.from_features(read_geojson(STATE_GEOJSON_PATH)["features"])
+        self.states = shapely.transform(shapely.force_2d(states.geometry.values), to_mercator)
+        self.state_properties = [{"name": name} for name in states['admin1Name']]
+        state_names = {state_key(name): name for name in states['admin1Name']}
+
+        ea_geometries, self.ea_properties = [], []
+        for file_name in sorted(os.listdir(polygons_dir)):
+            if not file_name.endswith(".geojson"):
+                continue
+            state_name = state_names.get(state_key(os.path.splitext(file_name)[0]), os.path.splitext(file_name)[0])
+            polygon_geojson_data = read_geojson(os.path.join(polygons_dir, file_name))
+            polygons, feature_index = ea_polygons(polygon_geojson_data)
+            ea_names = [feature["properties"].get("EA_NAME") for feature in polygon_geojson_data["features"]]
+            ea_geometries.append(polygons)
+            self.ea_properties += [{"name": ea_names[i], "state": state_name} for i in feature_index]
+        self.eas = shapely.transform(np.concatenate(ea_geometries) if ea_geometries else np.empty(0, dtype=object), to_mercator)
+
+        # FAP points, with the code of their properties: every distinct combination of properties puts its points
+        # in the same layers (the country's and its state's of each layered column)
+        faps = read_fap_data(csv_path, MAP_COLUMNS).dropna(subset=['LATITUDE', 'LONGITUDE'])
+        self.fap_coords = to_mercator(faps[['LONGITUDE', 'LATITUDE']].to_numpy(dtype=np.float64))
+        self.fap_codes, combinations = pd.factorize(pd.MultiIndex.from_frame(faps[list(FAP_PROPERTY_COLUMNS)].astype(object)))
+        self.fap_properties = [dict(zip(FAP_PROPERTY_COLUMNS, combination)) for combination in combinations]
+
+        self.state_tree = shapely.STRtree(self.states)
+        self.ea_tree = shapely.STRtree(self.eas)
+        self.fap_tree = shapely.STRtree(shapely.points(self.fap_coords))
+        self.bounds = tuple(shapely.total_bounds(self.states))
+
+    # Function to add the polygons found in a tile to a layer, in tile coordinates
+    def _add_polygons(self, layer, tree, geometries, properties, bounds):
+        minx, miny, maxx, maxy = bounds
+        scale = TILE_EXTENT / (maxx - minx)
+        margin = TILE_BUFFER / scale
+        found = tree.query(shapely.box(minx - margin, miny - margin, maxx + margin, maxy + margin))
+        if not len(found):
+            return
+        found.sort()
+        clipped = shapely.clip_by_rect(geometries[found], minx - margin, miny - margin, maxx + margin, maxy + margin)
+        in_tile = shapely.transform(clipped, lambda coords: (coords - (minx, maxy)) * (scale, -scale))
+        in_tile = shapely.set_precision(shapely.simplify(in_tile, 1.0), 1.0)  # Integer tile coordinates
+        for index, geometry in zip(found, in_tile):
+            rings = []
+            for polygon in shapely.get_parts(geometry):
+                if shapely.get_type_id(polygon) != shapely.GeometryType.POLYGON:
+                    continue  # Collapsed to a line or point at this zoom
+                for exterior, ring in [(True, polygon.exterior)] + [(False, interior) for interior in polygon.interiors]:
+                    coords = np.asarray(ring.coords, dtype=np.int64)[:-1]
+                    if len(coords) >= 3:
+                        rings.append(coords if (ring_area(coords) > 0) == exterior else coords[::-1])
+            if rings:
+                layer.add(3, polygon_geometry(rings), properties[index])
+
+    # Function to encode one tile (empty bytes when nothing lies in it)
+    def tile(self, z, x, y):
+        bounds = tile_bounds(z, x, y)
+        layers = {name: TileLayer(name) for name in ("states", "eas")}
+        self._add_polygons(layers["states"], self.state_tree, self.states, self.state_properties, bounds)
+        if z >= EA_MIN_ZOOM:
+            self._add_polygons(layers["eas"], self.ea_tree, self.eas, self.ea_properties, bounds)
+
+        # FAP points in tile coordinates, one feature per distinct (properties, position): at low zooms many FAPs
+        # of a town share a tile coordinate and draw as one circle anyway
+        minx, miny, maxx, maxy = bounds
+        scale = TILE_EXTENT / (maxx - minx)
+        found = self.fap_tree.query(shapely.box(minx, miny, maxx, maxy))
+        points = np.column_stack((
+            self.fap_codes[found],
+            np.floor((self.fap_coords[found, 0] - minx) * scale),
+            np.floor((maxy - self.fap_coords[found, 1]) * scale),
+        )).astype(np.int64)
+        points = points[((points[:, 1:] >= 0) & (points[:, 1:] < TILE_EXTENT)).all(axis=1)]  # Points on an edge go to one tile
+        points = np.unique(points, axis=0)
+        for code, start, count in zip(*np.unique(points[:, 0], return_index=True, return_counts=True)):
+            properties = self.fap_properties[code]
+            coords = points[start:start + count, 1:]
+            for selected_state in ('All', properties['STATE']):
+                for column in FAP_LAYER_COLUMNS:
+                    name = fap_layer(selected_state, column, properties[column])
+                    layers.setdefault(name, TileLayer(name)).add_points(coords, properties)
+
+        return b"".join(_bytes_field(3, layer.encode()) for layer in layers.values() if layer.features)
+
+    # Function to describe the tiles as TileJSON
+    def tilejson(self, url):
+        lon_lat = lambda mx, my: (math.degrees(mx / MERCATOR_RADIUS), math.degrees(2 * math.atan(math.exp(my / MERCATOR_RADIUS)) - math.pi / 2))
+        minx, miny, maxx, maxy = self.bounds
+        return dict(tilejson="2.2.0", name="A2F FAP", version=self.version, tiles=[url], minzoom=0, maxzoom=MAX_ZOOM,
+                    bounds=list(lon_lat(minx, miny) + lon_lat(maxx, maxy)))
+
+
+# Function to get the file of a tile in the tile directory
+def tile_path(tiles_dir, version, z, x, y):
+    return os.path.join(tiles_dir, version, str(z), str(x), f"{y}.pbf")
+
+# Function to write a tile atomically
+def write_tile(file_path, content):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temporary_path = f"{file_path}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+    os.replace(temporary_path, file_path)
+
+# Function to build the tiles of the given zooms over Nigeria. Returns (tiles written, tiles with content).
+def build_tiles(tiles_dir=TILES_DIR, csv_path=CSV_PATH, zooms=BUILD_ZOOMS, progress=None):
+    source = TileSource(csv_path)
+    written = non_empty = 0
+    for z in zooms:
+        for x, y in tiles_covering(source.bounds, z):
+            content = source.tile(z, x, y)
+            write_tile(tile_path(tiles_dir, source.version, z, x, y), content)
+            written += 1
+            non_empty += bool(content)
+        if progress:
+            progress(z, written)
+    return written, non_empty
+
+
+# HTTP handler serving /<version>/<z>/<x>/<y>.pbf from the tile directory, cutting missing tiles of the current
+# version on request. Tiles are gzipped for clients accepting it and sent with long-lived cache headers.
+class TileRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "A2FTiles/1"
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) == 2 and parts[1] == "tiles.json" and parts[0] == self.server.current_source().version:
+            url = f"http://{self.headers.get('Host', 'localhost')}/{parts[0]}/{{z}}/{{x}}/{{y}}.pbf"
+            return self._send(200, json.dumps(self.server.current_source().tilejson(url)).encode("utf-8"), "application/json", cache=False)
+        try:
+            version, z, x, y = parts[0], int(parts[1]), int(parts[2]), int(parts[3].removesuffix(".pbf"))
+        except (IndexError, ValueError):
+            return self._send(404, b"", "text/plain", cache=False)
+        if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return self._send(404, b"", "text/plain", cache=False)
+
+        file_path = tile_path(self.server.tiles_dir, version, z, x, y)
+        if os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                content = f.read()
+        elif version == self.server.current_source().version:
+            content = self.server.current_source().tile(z, x, y)
+            write_tile(file_path, content)
+        else:
+            return self._send(404, b"", "text/plain", cache=False)  # Tiles of an older version that were never cut
+        self._send(200, content, "application/vnd.mapbox-vector-tile")
+
+    def _send(self, status, content, content_type, cache=True):
+        if content and "gzip" in self.headers.get("Accept-Encoding", ""):
+            content = gzip.compress(content, 6)
+            encoding = "gzip"
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Access-Control-Allow-Origin", "*")  # Maps are served by the Streamlit server, another origin
+        self.send_header("Cache-Control", TILE_CACHE_CONTROL if cache else "no-cache")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+# Tile HTTP server: keeps the tile source of the current inputs, reloading it when the survey data or geo files change
+class TileServer(http.server.ThreadingHTTPServer):
+    def __init__(self, address, tiles_dir=TILES_DIR, csv_path=CSV_PATH):
+        super().__init__(address, TileRequestHandler)
+        self.tiles_dir = tiles_dir
+        self.csv_path = csv_path
+        self._source = TileSource(csv_path)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Function to get the tile source, checking at most every few seconds whether its inputs changed
+    def current_source(self):
+        with self._lock:
+            if time.monotonic() - self._checked > TILE_VERSION_CHECK_SECONDS:
+                self._checked = time.monotonic()
+                if tile_version(self.csv_path) != self._source.version:
+                    self._source = TileSource(self.csv_path)
+            return self._source
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and serve vector tiles of the state boundaries, EA polygons and FAP points.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build the tiles of the low zooms up front")
+    build_parser.add_argument("--zooms", nargs="+", type=int, default=list(BUILD_ZOOMS))
+    serve_parser = subparsers.add_parser("serve", help="Serve the tiles, cutting deeper zooms on request")
+    serve_parser.add_argument("--port", type=int, default=TILE_SERVER_PORT)
+    for command_parser in (build_parser, serve_parser):
+        command_parser.add_argument("--tiles-dir", default=TILES_DIR)
+        command_parser.add_argument("--csv", default=CSV_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        written, non_empty = build_tiles(args.tiles_dir, args.csv, args.zooms, progress=lambda z, written: print(f"zoom {z} done, {written} tiles built"))
+        print(f"Built {written} tiles ({non_empty} with content) in {args.tiles_dir}/{tile_version(args.csv)}")
+    else:
+        server = TileServer(("", args.port), args.tiles_dir, args.csv)
+        print(f"Serving tiles on http://localhost:{args.port}, set {TILE_URL_ENV}=http://localhost:{args.port} for the app")
+        server.serve_forever()
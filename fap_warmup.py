@@ -0,0 +1,86 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+from streamlit.runtime import Runtime
+
+# Set A2F_WARM_UP=0 to skip preloading the shared assets when the server starts
+WARM_UP_ENV = "A2F_WARM_UP"
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FAP_STATUS.py")
+
+logger = logging.getLogger("a2f.warmup")
+
+# Function to load every shared asset into the process caches: survey data, selection index, aggregate cube,
+# nearest-FAP proximity, location checks, state boundaries at every level of detail and the base layers of every
+# state's map.
+# Runs the same cached loaders as the pages, so a page asking for an asset that is still loading waits for it
+# instead of loading it twice.
+def warm_up():
+    started = time.perf_counter()
+
+    from fap_assets import (load_aggregate_cube, load_ea_proximity, load_geo_bundle, load_location_checks, load_selection_index,
+                            load_state_gdf, load_state_geojson, load_state_geometry)
+    from fap_data import CSV_PATH, MAP_COLUMNS
+    from fap_geo import GEOMETRY_LEVELS, STATE_GEOJSON_PATH
+    from fap_maps import load_base_layers
+
+    selection_index = load_selection_index(CSV_PATH, MAP_COLUMNS)
+    aggregate_cube = load_aggregate_cube(CSV_PATH)
+    load_state_geojson(STATE_GEOJSON_PATH)
+    load_state_gdf(STATE_GEOJSON_PATH)
+    for min_zoom, _, _ in GEOMETRY_LEVELS:
+        load_state_geometry(STATE_GEOJSON_PATH, min_zoom)
+    load_geo_bundle()
+
+    # Base layers of the national map and of every state the pages offer
+    for selected_state in ['All'] + sorted(selection_index.data['STATE'].unique()):
+        load_base_layers(selected_state)
+
+    # Nearest-FAP proximity of every EA, for every FAP type page 3 offers
+    for fap_type in aggregate_cube.values('FAP_TYPE'):
+        load_ea_proximity(CSV_PATH, fap_type)
+
+    # Location checks of every FAP against its state and EA polygons (page 4)
+    load_location_checks(CSV_PATH)
+
+    logger.info("Warm-up finished in %.1f s", time.perf_counter() - started)
+
+# Function to start the warm-up in a background thread, once per process (the launcher below or else the first
+# script run starts it, later calls get the same thread back). Returns None when the warm-up is disabled.
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    if os.environ.get(WARM_UP_ENV, "1") == "0":
+        return None
+    thread = threading.Thread(target=warm_up, name="a2f-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# Function to start the warm-up as soon as the Streamlit runtime of this process exists, before any session
+# connects (the cached loaders need the runtime's cache storage)
+def start_warm_up_with_server():
+    def wait_for_runtime():
+        while not Runtime.exists():
+            time.sleep(0.1)
+        start_warm_up()
+
+    threading.Thread(target=wait_for_runtime, name="a2f-warm-up-start", daemon=True).start()
+
+# Launcher of the app that warms up at server start: python fap_warmup.py [streamlit run options], e.g.
+# python fap_warmup.py --server.port 8501. Plain streamlit run FAP_STATUS.py warms up on the first script run instead.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the app's Streamlit server and warm up the shared assets as it starts.")
+    parser.add_argument("--app", default=APP_PATH, help="Streamlit script to serve")
+    args, streamlit_args = parser.parse_known_args()
+
+    # Imported by module name so the script's start_warm_up() call finds the thread started here in its cache
+    from fap_warmup import start_warm_up_with_server
+    from streamlit.web import cli
+
+    start_warm_up_with_server()
+    sys.argv = ["streamlit", "run", args.app, *streamlit_args]
+    sys.exit(cli.main())
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+# Bounded LRU cache of serialized Plotly figures (JSON strings), shared by every session of a process.
+# Entries are evicted least recently used first once the total size of the cached JSON exceeds max_bytes.
+class FigureCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Function to get a cached figure JSON, or None when the key is not cached
+    def get(self, key):
+        with self._lock:
+            figure_json = self._entries.get(key)
+            if figure_json is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return figure_json
+
+    # Function to add a figure JSON, evicting least recently used entries to stay within the memory budget
+    def put(self, key, figure_json):
+        size = len(figure_json)
+        if size > self.max_bytes:
+            return  # Larger than the whole budget, never cached
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous)
+            self._entries[key] = figure_json
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    # Function to drop every cached figure
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from fap_data import CUBE_DIMENSIONS, KM_DIFF_COLUMN, MAX_KM_DIFF, AggregateCube, add_km_diff
+
+
+# Survey rows with missing dimensions: a Kano FAP without FORMALITY and a Lagos FAP without EA NAME
+def survey_rows():
+    return pd.DataFrame({
+        'STATE': pd.Categorical(['Kano', 'Lagos', 'Lagos', 'Oyo']),
+        'EA NAME': ['EA 1', None, 'EA 2', 'EA 3'],
+        'FAP_TYPE': pd.Categorical(['MFI/MFB', 'Bank branch', 'Bank branch', None]),
+        'FAP_FUNCTIONALITY': pd.Categorical(['Active', 'Active', 'Inactive', 'Active']),
+        'FORMALITY': pd.Categorical([None, 'Formal', 'Formal', 'Informal']),
+        KM_DIFF_COLUMN: [1.0, 2.0, np.nan, 4.0],
+        'InstanceID': [1, 2, 3, 4],
+    })
+
+# Function to compare the cube's state rollups with the groupby of the survey rows the app used before the cube
+def assert_matches_baseline(cube, data):
+    rolled = cube.rollup(['STATE', 'FAP_FUNCTIONALITY'])['count'].unstack(fill_value=0)
+    expected = data.groupby('STATE', observed=True)['FAP_FUNCTIONALITY'].value_counts().unstack(fill_value=0)
+    pd.testing.assert_frame_equal(rolled, expected, check_names=False, check_dtype=False, check_index_type=False, check_column_type=False)
+
+    means = cube.rollup(['STATE'])['km_mean']
+    expected_means = data.groupby('STATE', observed=True)[KM_DIFF_COLUMN].mean()
+    pd.testing.assert_series_equal(means, expected_means, check_names=False, check_index_type=False)
+
+
+def test_cube_keeps_rows_with_missing_dimensions():
+    data = survey_rows()
+    cube = AggregateCube(data)
+    assert cube.cells['count'].sum() == len(data)
+    assert_matches_baseline(cube, data)
+
+def test_upsert_keeps_missing_dimensions_as_nan():
+    data = survey_rows()
+    replaced, added = data.iloc[[1]], data.iloc[[1]].assign(**{KM_DIFF_COLUMN: 5.0})
+    updated = pd.concat([data.drop(index=1), added], ignore_index=True)
+    cube = AggregateCube(data).upsert(replaced, added)
+    for dimension in CUBE_DIMENSIONS:
+        assert 'nan' not in set(cube.cells[dimension].dropna().astype(str))
+    assert cube.cells['count'].sum() == len(updated)
+    assert_matches_baseline(cube, updated)
+
+def test_add_km_diff_keeps_surveyed_distances():
+    # A surveyed distance, a missing one with coordinates 1.1 km apart, and a missing one with misplaced coordinates
+    data = pd.DataFrame({
+        'LATITUDE': [6.50, 6.51, 9.00],
+        'LONGITUDE': [3.30, 3.30, 3.30],
+        'EA.LATITUDE': [7.50, 6.50, 6.50],
+        'EA.LONGITUDE': [3.30, 3.30, 3.30],
+        KM_DIFF_COLUMN: [0.6, np.nan, np.nan],
+    })
+    km_diff = add_km_diff(data)[KM_DIFF_COLUMN]
+    assert km_diff[0] == 0.6
+    assert abs(km_diff[1] - 1.11) < 0.01
+    assert np.isnan(km_diff[2])
+
+    # Without a distance column every distance is computed, those above the cap left missing
+    km_diff = add_km_diff(data.drop(columns=KM_DIFF_COLUMN))[KM_DIFF_COLUMN]
+    assert np.isnan(km_diff[0]) and np.isnan(km_diff[2]) and km_diff[1] <= MAX_KM_DIFF
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from fap_proximity import NEAREST_K, NearestFapIndex, ea_proximity
+
+
+# FAPs of two types around an EA: three POS agents and a single BDC, fewer than NEAREST_K
+def fap_rows():
+    return pd.DataFrame({
+        'STATE': ['Lagos'] * 4,
+        'FAP_TYPE': ['POS', 'POS', 'POS', 'BDC'],
+        'FAP_FUNCTIONALITY': ['Active', 'Active', 'Inactive', 'Active'],
+        'LATITUDE': [6.50, 6.51, 6.52, 6.50],
+        'LONGITUDE': [3.30, 3.31, 3.32, 3.30],
+    })
+
+def eas():
+    return pd.DataFrame({'STATE': ['Lagos'], 'EA NAME': ['EA 1'], 'EA.LATITUDE': [6.50], 'EA.LONGITUDE': [3.30]})
+
+
+def test_missing_neighbours_are_inf():
+    index = NearestFapIndex(fap_rows())
+    nearest = index.nearest_km('BDC', np.array([6.5]), np.array([3.3]), k=NEAREST_K)
+    assert nearest[0, 0] < 0.001
+    assert np.isinf(nearest[0, 1:]).all()
+
+def test_ea_proximity_with_fewer_faps_than_k():
+    index = NearestFapIndex(fap_rows())
+    proximity = ea_proximity(index, eas(), 'BDC')
+    assert proximity['Nearest FAP (km)'][0] < 0.001
+    assert np.isnan(proximity[f'Mean of {NEAREST_K} nearest (km)'][0])  # Not a mean over half the Earth's circumference
+
+    proximity = ea_proximity(index, eas(), 'POS')
+    assert proximity[f'Mean of {NEAREST_K} nearest (km)'][0] < 5